@@ -0,0 +1,180 @@
+import logging
+import threading
+import time
+
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import cache
+
+
+logger = logging.getLogger(__name__)
+ENTREE = settings.ENTREE
+
+NAMESPACE_KEY = 'entree:ns:%s'
+NAMESPACE_TIMEOUT = 30 * 24 * 60 * 60  # 30 days
+STATS_KEY = 'entree:stats:%s:%s'
+STATS_TIMEOUT = 30 * 24 * 60 * 60  # 30 days
+STATS_EVENTS = ('hit', 'miss')
+
+#all CacheStats instances, by name
+STATS = {}
+
+
+def get_namespace_version(name):
+    """
+    Version of cache namespace, should be part of keys stored in the namespace.
+    Lost version is replaced by timestamp-based one, so keys stored under \
+    the old version are never used again.
+
+    @param name: namespace name
+    @type name: str
+    @rtype: int
+    """
+    key = NAMESPACE_KEY % name
+    version = cache.get(key)
+    if version is None:
+        cache.add(key, int(time.time() * 1000), NAMESPACE_TIMEOUT)
+        version = cache.get(key)
+    return version
+
+
+def bump_namespace_version(name):
+    """
+    Invalidate all keys stored in given namespace
+    """
+    key = NAMESPACE_KEY % name
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.set(key, int(time.time() * 1000), NAMESPACE_TIMEOUT)
+
+
+class CacheStats(object):
+    """
+    Hit/miss counter of some cache.
+    Events are counted locally and added into shared cache once in a while, \
+    so counts of all processes are summed up w/o extra round trip on each read.
+    """
+
+    def __init__(self, name, flush_every=100):
+        self.name = name
+        self.flush_every = flush_every
+        self.local = dict([(one, 0) for one in STATS_EVENTS])
+        STATS[name] = self
+
+    def hit(self):
+        self.count('hit')
+
+    def miss(self):
+        self.count('miss')
+
+    def count(self, event):
+        self.local[event] += 1
+        if sum(self.local.values()) >= self.flush_every:
+            self.flush()
+
+    def flush(self):
+        for event, count in self.local.items():
+            if not count:
+                continue
+            self.local[event] = 0
+
+            key = STATS_KEY % (self.name, event)
+            try:
+                cache.incr(key, count)
+            except ValueError:
+                cache.set(key, count, STATS_TIMEOUT)
+
+    def get_counts(self):
+        """
+        @return: counts of all events summed up for all processes
+        @rtype: dict
+        """
+        self.flush()
+        return dict([(one, cache.get(STATS_KEY % (self.name, one), 0)) for one in STATS_EVENTS])
+
+    def reset(self):
+        self.local = dict([(one, 0) for one in STATS_EVENTS])
+        cache.delete_many([STATS_KEY % (self.name, one) for one in STATS_EVENTS])
+
+
+class LocalCache(object):
+    """
+    Bounded process-local LRU cache, purposed to be used in front of shared cache \
+    for rarely changed data.
+
+    Entries belong to a namespace. Its version is checked in shared cache at most \
+    once per `check_interval` seconds; when it moves, all local entries are dropped, \
+    so processes stay coherent with `check_interval` delay at most.
+    Stored values are shared by all threads, don't modify them.
+    """
+
+    def __init__(self, namespace, max_size=None, check_interval=None):
+        self.namespace = namespace
+        self.max_size = max_size if max_size is not None else ENTREE.get('LOCAL_CACHE_SIZE', 1000)
+        self.check_interval = check_interval if check_interval is not None else ENTREE.get('LOCAL_CACHE_CHECK', 5)
+
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self._version = None
+        self._checked = 0
+
+    def get_version(self):
+        """
+        @return: actual namespace version (checked at most once per `check_interval`)
+        @rtype: int
+        """
+        now = time.time()
+        if self._version is None or now - self._checked >= self.check_interval:
+            version = get_namespace_version(self.namespace)
+            with self._lock:
+                if version != self._version:
+                    self._data.clear()
+                    self._version = version
+                self._checked = now
+        return self._version
+
+    def get(self, key, default=None):
+        self.get_version()
+        with self._lock:
+            try:
+                value = self._data.pop(key)
+            except KeyError:
+                return default
+            self._data[key] = value
+            return value
+
+    def set(self, key, value, version=None):
+        """
+        @param version: namespace version value was loaded for, \
+            value is not stored if namespace moved in the meantime
+        @type version: int
+        """
+        if not self.max_size:
+            return
+
+        #namespace version has to be known, first get() would drop the entry otherwise
+        if self._version is None:
+            self.get_version()
+
+        with self._lock:
+            if version is not None and version != self._version:
+                return
+            self._data.pop(key, None)
+            self._data[key] = value
+            while len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def invalidate(self):
+        """
+        Drop namespace in all processes (local ones right now)
+        """
+        bump_namespace_version(self.namespace)
+        with self._lock:
+            self._data.clear()
+            self._version = None
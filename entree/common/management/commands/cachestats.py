@@ -0,0 +1,28 @@
+"""
+Management utility to show hit/miss counts of Entree caches
+"""
+from optparse import make_option
+
+from django.core.management.base import BaseCommand
+
+from entree.common.cache import STATS
+
+
+class Command(BaseCommand):
+    option_list = BaseCommand.option_list + (
+            make_option('--reset', action='store_true', dest='reset', default=False,
+                help='Reset counters after they are shown.'),
+        )
+
+    help = 'Show hit/miss counts of Entree caches, summed up for all processes.'
+
+    def handle(self, *args, **options):
+        for name, stats in sorted(STATS.items()):
+            counts = stats.get_counts()
+            total = sum(counts.values())
+            ratio = 100.0 * counts['hit'] / total if total else 0
+            self.stdout.write("%s: %s hits, %s misses (%.1f%% hit ratio)\n" % (
+                name, counts['hit'], counts['miss'], ratio))
+
+            if options.get('reset'):
+                stats.reset()
@@ -27,6 +27,6 @@ class AuthBackend(ModelBackend):
         @rtype: Identity
         """
         try:
-            return Identity.objects.get(pk=user_id)
-        except Identity.DoesNotExist:
+            return Identity.objects.get_cached(user_id)
+        except (Identity.DoesNotExist, ValueError, TypeError):
             logger.info("Unknown get_user id", extra={'user_id': user_id})
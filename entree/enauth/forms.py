@@ -4,10 +4,30 @@ from django import forms
 from django.utils.translation import ugettext_lazy as _
 
 from entree.enauth.backends import AuthBackend
+from entree.enauth.hashers import HashingBusy, make_password
 from entree.enauth.mailer import IdentityMailer
 from entree.enauth.models import Identity, LoginToken
 
 
+BUSY_MESSAGE = _("Server is too busy at the moment, please try again in a while.")
+
+
+class HashPasswordMixin(object):
+    """
+    Hash new password while form is cleaned, so saturated hashing executor \
+    is shown as form error. Hash is available as `password_hash` then.
+    """
+
+    def clean(self):
+        data = super(HashPasswordMixin, self).clean()
+        if data.get('password') and not self._errors:
+            try:
+                self.password_hash = make_password(data['password'])
+            except HashingBusy:
+                raise forms.ValidationError(BUSY_MESSAGE)
+        return data
+
+
 class EntreeAuthForm(forms.Form):
     username = forms.CharField(label=_("Username"), max_length=60)
     password = forms.CharField(label=_("Password"), widget=forms.PasswordInput)
@@ -20,7 +40,10 @@ class EntreeAuthForm(forms.Form):
     def clean(self):
         data = self.cleaned_data
         if 'username' in data and 'password' in data:
-            self.user_cache = AuthBackend().authenticate(username=data['username'], password=data['password'])
+            try:
+                self.user_cache = AuthBackend().authenticate(username=data['username'], password=data['password'])
+            except HashingBusy:
+                raise forms.ValidationError(BUSY_MESSAGE)
             if not self.user_cache:
                 raise forms.ValidationError(_("Please enter a correct username and password. Note that both fields are case-sensitive."))
 
@@ -43,7 +66,7 @@ class EntreeAuthForm(forms.Form):
         return self.user_cache
 
 
-class CreateIdentityForm(forms.ModelForm):
+class CreateIdentityForm(HashPasswordMixin, forms.ModelForm):
     password = forms.CharField(widget=forms.PasswordInput, label=_("Password"))
     password2 = forms.CharField(widget=forms.PasswordInput, label=_("Password again"))
 
@@ -60,7 +83,7 @@ class CreateIdentityForm(forms.ModelForm):
 
     def save(self, commit=True):
         user = super(CreateIdentityForm, self).save(commit=False)
-        user.set_password(self.cleaned_data["password"])
+        user.password = self.password_hash
         if commit:
             user.save()
         return user
@@ -87,7 +110,7 @@ class LogoutForm(forms.Form):
     pass
 
 
-class BasicPasswordForm(forms.Form):
+class BasicPasswordForm(HashPasswordMixin, forms.Form):
     password = forms.CharField(widget=forms.PasswordInput, label=_("New password"))
     password2 = forms.CharField(widget=forms.PasswordInput, label=_("New password"))
 
@@ -112,7 +135,12 @@ class ChangePasswordForm(BasicPasswordForm):
     def clean_old_password(self):
         data = self.cleaned_data
 
-        if not self.entree_user.check_password(data['old_password']):
+        try:
+            matches = self.entree_user.check_password(data['old_password'])
+        except HashingBusy:
+            raise forms.ValidationError(BUSY_MESSAGE)
+
+        if not matches:
             raise forms.ValidationError("Old password does not match")
 
 
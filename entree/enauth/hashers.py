@@ -0,0 +1,214 @@
+"""
+Optional executor running password hashing out of request thread.
+
+Strong hashers take a lot of CPU time; hashing them inline pins a core of web \
+worker per login and starves cheap requests (profile fetch, iframe) served \
+by the same process. When ENTREE['HASHING_PROCESSES'] is set, hashing is done \
+by a bounded pool of worker processes instead:
+
+ - ENTREE['HASHING_PROCESSES'] - number of hashing processes, 0 hashes inline (default)
+ - ENTREE['HASHING_QUEUE'] - max number of pending hashes per web process, \
+   HashingBusy is raised immediately when exceeded (default 4 x processes)
+ - ENTREE['HASHING_TIMEOUT'] - max seconds to wait for a result (default 10)
+ - ENTREE['HASHING_STATS_INTERVAL'] - queue depth and latency are logged (INFO) \
+   at most once per this number of seconds (default 60)
+"""
+import logging
+import threading
+import time
+
+from multiprocessing import Pool, TimeoutError
+
+from django.conf import settings
+from django.contrib.auth import hashers
+
+
+ENTREE = settings.ENTREE
+logger = logging.getLogger(__name__)
+
+
+class HashingBusy(Exception):
+    """
+    Hashing executor is saturated, try again later
+    """
+
+
+def _call(func, args):
+    """
+    Run by worker process; exceptions are returned, so pool's callback (which \
+    releases executor's slot) is called for failed jobs as well
+
+    @return: (succeeded, result or exception)
+    @rtype: tuple
+    """
+    try:
+        return True, func(*args)
+    except Exception, e:
+        return False, e
+
+
+def _check_password(raw_password, encoded):
+    """
+    Run by worker process, setter (rehash) can't be passed there
+
+    @return: (password matches, password should be rehashed)
+    @rtype: tuple
+    """
+    is_correct = hashers.check_password(raw_password, encoded)
+    must_update = False
+    if is_correct:
+        must_update = hashers.identify_hasher(encoded).algorithm != hashers.get_hasher().algorithm
+    return is_correct, must_update
+
+
+class HashingExecutor(object):
+
+    def __init__(self, processes, queue_limit=None, timeout=10, stats_interval=60):
+        self.processes = processes
+        self.queue_limit = queue_limit or processes * 4
+        self.timeout = timeout
+        self.stats_interval = stats_interval
+        self._reported = time.time()
+
+        self._pool = None
+        self._lock = threading.Lock()
+        self.pending = 0
+        self.done = 0
+        self.rejected = 0
+        self.timed_out = 0
+        self.total_time = 0.0
+
+    def get_pool(self):
+        with self._lock:
+            if self._pool is None:
+                self._pool = Pool(self.processes)
+            return self._pool
+
+    def run(self, func, *args):
+        """
+        Run func(*args) in some of worker processes and wait for the result.
+        Slot of the job is released when it's finished by worker, even if caller \
+        stopped waiting for it, so the queue limit bounds work really outstanding.
+
+        @raise HashingBusy: too many hashes are pending or result didn't come in time
+        """
+        with self._lock:
+            full = self.pending >= self.queue_limit
+            if full:
+                self.rejected += 1
+            else:
+                self.pending += 1
+
+        if full:
+            logger.warning("Hashing queue is full", extra={'pending': self.pending})
+            self.report_stats()
+            raise HashingBusy("Hashing queue is full")
+
+        started = time.time()
+        try:
+            result = self.get_pool().apply_async(_call, (func, args), callback=lambda value: self._finished(started))
+        except:
+            with self._lock:
+                self.pending -= 1
+            raise
+
+        try:
+            succeeded, value = result.get(self.timeout)
+        except TimeoutError:
+            with self._lock:
+                self.timed_out += 1
+            self.report_stats()
+            raise HashingBusy("Hashing timed out")
+
+        if not succeeded:
+            raise value
+        return value
+
+    def _finished(self, started):
+        """
+        Called by pool when job is done
+        """
+        elapsed = time.time() - started
+        with self._lock:
+            self.pending -= 1
+            self.done += 1
+            self.total_time += elapsed
+        logger.debug("Password hashed in %.3fs", elapsed)
+        self.report_stats()
+
+    def report_stats(self):
+        """
+        Log stats, at most once per `stats_interval` seconds
+        """
+        now = time.time()
+        with self._lock:
+            if now - self._reported < self.stats_interval:
+                return
+            self._reported = now
+
+        logger.info("Hashing: %(pending)s pending, %(done)s done, %(rejected)s rejected, "
+                    "%(timed_out)s timed out, %(avg_time).3fs avg", self.get_stats())
+
+    def get_stats(self):
+        """
+        @return: queue depth, counts of finished/rejected/timed out hashes \
+            and avg latency (in seconds)
+        @rtype: dict
+        """
+        return {
+            'pending': self.pending,
+            'done': self.done,
+            'rejected': self.rejected,
+            'timed_out': self.timed_out,
+            'avg_time': self.total_time / self.done if self.done else 0,
+        }
+
+
+_executor = None
+
+
+def get_executor():
+    """
+    @return: executor of this process, None if hashing is done inline
+    @rtype: HashingExecutor
+    """
+    global _executor
+    processes = ENTREE.get('HASHING_PROCESSES', 0)
+    if not processes:
+        return None
+
+    if _executor is None:
+        _executor = HashingExecutor(processes, ENTREE.get('HASHING_QUEUE'), ENTREE.get('HASHING_TIMEOUT', 10),
+                                    ENTREE.get('HASHING_STATS_INTERVAL', 60))
+    return _executor
+
+
+def make_password(raw_password):
+    """
+    Same as django.contrib.auth.hashers.make_password, done by executor if enabled
+
+    @raise HashingBusy
+    """
+    executor = get_executor()
+    if executor is None:
+        return hashers.make_password(raw_password)
+    return executor.run(hashers.make_password, raw_password)
+
+
+def check_password(raw_password, encoded, setter=None):
+    """
+    Same as django.contrib.auth.hashers.check_password, done by executor if enabled
+
+    @raise HashingBusy
+    """
+    executor = get_executor()
+    if executor is None:
+        return hashers.check_password(raw_password, encoded, setter)
+
+    if not raw_password or not hashers.is_password_usable(encoded):
+        return False
+
+    is_correct, must_update = executor.run(_check_password, raw_password, encoded)
+    if setter and is_correct and must_update:
+        setter(raw_password)
+    return is_correct
@@ -0,0 +1,214 @@
+"""
+Management utility to import Entree identities in bulk
+"""
+import csv
+import sys
+import time
+
+import simplejson as json
+
+from itertools import islice
+from multiprocessing import Pool, cpu_count
+from optparse import make_option
+
+from django.contrib.auth.hashers import make_password
+from django.core.exceptions import ValidationError
+from django.core.management.base import CommandError, BaseCommand
+from django.core.validators import validate_email
+from django.db import transaction, IntegrityError
+from django.db.utils import DEFAULT_DB_ALIAS
+
+from entree.enauth.models import Identity
+
+
+FORMATS = ('csv', 'jsonl')
+BOOLEAN_TRUE = ('1', 'true', 'yes')
+
+
+def hash_password(raw_password):
+    """
+    Module-level, so it can be run by worker processes
+    """
+    return make_password(raw_password or None)
+
+
+def to_bool(value):
+    if isinstance(value, basestring):
+        return value.strip().lower() in BOOLEAN_TRUE
+    return bool(value)
+
+
+class Command(BaseCommand):
+    args = '<file>'
+    option_list = BaseCommand.option_list + (
+            make_option('--format', action='store', dest='format', default=None,
+                help='Input format, one of: %s. Default is guessed from file extension.' % ', '.join(FORMATS)),
+            make_option('--hashed', action='store_true', dest='hashed', default=False,
+                help='Passwords in input are already hashed, store them as they are.'),
+            make_option('--batch-size', action='store', type='int', dest='batch_size', default=1000,
+                help='Number of identities inserted in one statement. Default is 1000.'),
+            make_option('--processes', action='store', type='int', dest='processes', default=cpu_count(),
+                help='Number of processes hashing passwords. Default is number of CPUs.'),
+            make_option('--database', action='store', dest='database',
+                default=DEFAULT_DB_ALIAS, help='Specifies the database to use. Default is "default".'),
+        )
+
+    help = ('Import identities from CSV or JSON Lines file (use - for standard input). '
+            'Each record contains email, password and optionally is_active and mail_verified. '
+            'Identities w/ already registered email are skipped.')
+
+    def handle(self, *args, **options):
+        if len(args) != 1:
+            raise CommandError("You must provide exactly one input file")
+
+        path = args[0]
+        input_format = options.get('format') or path.rsplit('.', 1)[-1].lower()
+        batch_size = options.get('batch_size')
+        processes = options.get('processes')
+        verbosity = int(options.get('verbosity', 1))
+        self.database = options.get('database')
+
+        if input_format not in FORMATS:
+            raise CommandError("Unknown format: %s, use --format" % input_format)
+
+        if batch_size < 1:
+            raise CommandError("Batch size has to be positive number")
+
+        source = sys.stdin if path == '-' else open(path, 'rb')
+        pool = None
+        if not options.get('hashed') and processes > 1:
+            pool = Pool(processes)
+
+        started = time.time()
+        imported = skipped = 0
+        try:
+            records = self.read_records(source, input_format)
+            while True:
+                batch = list(islice(records, batch_size))
+                if not batch:
+                    break
+
+                if not options.get('hashed'):
+                    passwords = [one.get('password') for one in batch]
+                    if pool:
+                        hashed = pool.map(hash_password, passwords, max(1, len(passwords) / (processes * 4)))
+                    else:
+                        hashed = map(hash_password, passwords)
+                    for record, password in zip(batch, hashed):
+                        record['password'] = password
+
+                created = self.import_batch(batch)
+                imported += created
+                skipped += len(batch) - created
+
+                if verbosity:
+                    self.report(imported, skipped, started)
+        finally:
+            if pool:
+                pool.close()
+                pool.join()
+            if source is not sys.stdin:
+                source.close()
+
+    def read_records(self, source, input_format):
+        """
+        Malformed records (short CSV rows, invalid JSON) are reported and skipped
+
+        @rtype: generator
+        @return: dict for each record in input
+        """
+        if input_format == 'csv':
+            reader = csv.DictReader(source)
+            for row in reader:
+                if None in row.values():
+                    self.stderr.write("Skipping incomplete record on line %s" % reader.line_num)
+                    continue
+                yield dict([(key, val.decode('utf-8')) for key, val in row.items() if key])
+        else:
+            for line_num, line in enumerate(source, 1):
+                if not line.strip():
+                    continue
+                try:
+                    yield json.loads(line)
+                except ValueError:
+                    self.stderr.write("Skipping invalid record on line %s" % line_num)
+
+    def import_batch(self, batch):
+        """
+        Insert identities by one statement, records w/ invalid, duplicate or \
+        already registered emails are skipped.
+
+        @param batch: records w/ hashed passwords
+        @type batch: list
+        @return: number of inserted identities
+        @rtype: int
+        """
+        identities = {}
+        for record in batch:
+            email = (record.get('email') or '').strip().lower()
+            if email in identities:
+                continue
+
+            try:
+                validate_email(email)
+            except ValidationError:
+                continue
+
+            identities[email] = Identity(
+                email=email,
+                password=record.get('password') or make_password(None),
+                is_active=to_bool(record.get('is_active', False)),
+                mail_verified=to_bool(record.get('mail_verified', False)),
+            )
+
+        for email in self.get_registered(identities.keys()):
+            identities.pop(email, None)
+
+        if not identities:
+            return 0
+        return self.insert(identities.values())
+
+    def get_registered(self, emails):
+        """
+        @return: emails already registered
+        @rtype: list
+        """
+        return list(Identity.objects.db_manager(self.database).filter(email__in=emails).values_list('email', flat=True))
+
+    def insert(self, identities):
+        """
+        Insert identities by one statement. If some of emails were registered \
+        in the meantime, insert identities one by one and skip conflicting ones.
+
+        @type identities: list
+        @return: number of inserted identities
+        @rtype: int
+        """
+        using = self.database
+        with transaction.commit_on_success(using=using):
+            sid = transaction.savepoint(using=using)
+            try:
+                Identity.objects.db_manager(using).bulk_create(identities)
+            except IntegrityError:
+                transaction.savepoint_rollback(sid, using=using)
+            else:
+                transaction.savepoint_commit(sid, using=using)
+                return len(identities)
+
+            inserted = 0
+            for identity in identities:
+                sid = transaction.savepoint(using=using)
+                try:
+                    identity.save(force_insert=True, using=using)
+                except IntegrityError:
+                    transaction.savepoint_rollback(sid, using=using)
+                else:
+                    transaction.savepoint_commit(sid, using=using)
+                    inserted += 1
+            return inserted
+
+    def report(self, imported, skipped, started):
+        elapsed = time.time() - started
+        rate = (imported + skipped) / elapsed if elapsed else 0
+        self.stdout.write("%s identities imported, %s skipped in %.1fs (%.0f records/s)\n" % (
+            imported, skipped, elapsed, rate))
@@ -0,0 +1,79 @@
+"""
+Management utility to delete expired Entree tokens
+"""
+import time
+
+from optparse import make_option
+
+from django.core.cache import cache
+from django.core.management.base import CommandError, BaseCommand
+from django.db import transaction
+from django.db.models.sql.subqueries import DeleteQuery
+from django.db.utils import DEFAULT_DB_ALIAS
+
+from entree.enauth.managers import get_token_cache_key
+from entree.enauth.models import LoginToken, TOKEN_TYPES
+
+
+class Command(BaseCommand):
+    option_list = BaseCommand.option_list + (
+            make_option('--type', action='append', dest='token_types', default=None,
+                help='Purge only tokens of given type (can be used repeatedly). Default is all types.'),
+            make_option('--batch-size', action='store', type='int', dest='batch_size', default=1000,
+                help='Number of tokens deleted in one statement. Default is 1000.'),
+            make_option('--sleep', action='store', type='float', dest='sleep', default=0,
+                help='Seconds to wait between two batches, gives some air to a busy database.'),
+            make_option('--database', action='store', dest='database',
+                default=DEFAULT_DB_ALIAS, help='Specifies the database to use. Default is "default".'),
+        )
+
+    help = 'Delete expired Entree tokens in small batches.'
+
+    def handle(self, *args, **options):
+        token_types = options.get('token_types') or [one for one, _ in TOKEN_TYPES]
+        batch_size = options.get('batch_size')
+        sleep = options.get('sleep')
+        verbosity = int(options.get('verbosity', 1))
+        database = options.get('database')
+
+        unknown = set(token_types) - set(dict(TOKEN_TYPES).keys())
+        if unknown:
+            raise CommandError("Unknown token type: %s" % ', '.join(sorted(unknown)))
+
+        if batch_size < 1:
+            raise CommandError("Batch size has to be positive number")
+
+        for token_type in token_types:
+            deleted = self.purge(token_type, batch_size, sleep, database)
+            if verbosity:
+                self.stdout.write("%s: %s expired tokens deleted.\n" % (token_type, deleted))
+
+    def purge(self, token_type, batch_size, sleep, database):
+        """
+        Delete expired tokens of given type, `batch_size` rows at once.
+        Rows are deleted directly (w/o loading instances and firing delete signals),
+        so cache entries of deleted tokens are flushed here.
+
+        @return: number of deleted tokens
+        @rtype: int
+        """
+        expired = LoginToken.objects.db_manager(database).expired(token_type)
+
+        deleted = 0
+        while True:
+            batch = list(expired.order_by('touched').values_list('pk', 'value')[:batch_size])
+            if not batch:
+                break
+
+            DeleteQuery(LoginToken).delete_batch([pk for pk, value in batch], database)
+            transaction.commit_unless_managed(using=database)
+            cache.delete_many([get_token_cache_key(value) for pk, value in batch])
+
+            deleted += len(batch)
+            if len(batch) < batch_size:
+                break
+
+            if sleep:
+                time.sleep(sleep)
+
+        return deleted
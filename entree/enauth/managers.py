@@ -1,9 +1,26 @@
 import logging
+import re
 
+from django.conf import settings
+from django.core.cache import cache
 from django.db import models
 
 
 logger = logging.getLogger(__name__)
+ENTREE = settings.ENTREE
+
+IDENTITY_CACHE_KEY = 'entree:identity:%s'
+TOKEN_CACHE_KEY = 'entree:token:%s'
+TOKEN_MISSING = 'MISSING'
+TOKEN_FORMAT = re.compile('^[A-Z0-9]{1,40}$')
+
+
+def get_token_cache_key(value):
+    return TOKEN_CACHE_KEY % value
+
+
+def get_identity_cache_key(pk):
+    return IDENTITY_CACHE_KEY % pk
 
 
 class IdentityManager(models.Manager):
@@ -17,3 +34,81 @@ class IdentityManager(models.Manager):
         obj.set_password(pwd)
         obj.save(using=self.db)
         return obj
+
+    def get_cached(self, pk):
+        """
+        Resolve identity by its pk, read-through cached.
+        Cached item is flushed whenever Identity is saved or deleted.
+
+        @param pk: Identity.pk
+        @type pk: int
+        @rtype: Identity
+
+        @raise Identity.DoesNotExist
+        """
+        key = get_identity_cache_key(pk)
+        identity = cache.get(key)
+        if identity is None:
+            identity = self.get_query_set().get(pk=pk)
+            cache.set(key, identity, ENTREE.get('CACHE_IDENTITY', 5 * 60))
+        return identity
+
+
+class LoginTokenManager(models.Manager):
+    def get_cached(self, value):
+        """
+        Resolve token by its value, remember both found and missing tokens.
+        Missing tokens are kept only for a short while (CACHE_TOKEN_MISSING),
+        cached items are flushed whenever LoginToken is saved or deleted.
+
+        @param value: LoginToken.value
+        @type value: str
+        @return: LoginToken matching given value
+        @rtype: LoginToken
+
+        @raise LoginToken.DoesNotExist
+        """
+        if not value or not TOKEN_FORMAT.match(value):
+            raise self.model.DoesNotExist("Malformed token value")
+
+        key = get_token_cache_key(value)
+        token = cache.get(key)
+        if token == TOKEN_MISSING:
+            raise self.model.DoesNotExist("Token is cached as missing")
+
+        if token is None:
+            try:
+                token = self.get_query_set().get(value=value)
+            except self.model.DoesNotExist:
+                cache.set(key, TOKEN_MISSING, ENTREE.get('CACHE_TOKEN_MISSING', 30))
+                raise
+            cache.set(key, token, ENTREE.get('CACHE_TOKEN', 5 * 60))
+
+        return token
+
+    def valid(self, token_type):
+        """
+        @type token_type: str
+        @param token_type: type of token, should be listed in TOKEN_TYPES
+
+        @return: tokens of given type which are not expired yet
+        @rtype: QuerySet
+        """
+        qs = self.get_query_set().filter(token_type=token_type)
+        cutoff = self.model.expiry_cutoff(token_type)
+        if cutoff is not None:
+            qs = qs.filter(touched__gte=cutoff)
+        return qs
+
+    def expired(self, token_type):
+        """
+        @type token_type: str
+        @param token_type: type of token, should be listed in TOKEN_TYPES
+
+        @return: tokens of given type which are expired
+        @rtype: QuerySet
+        """
+        cutoff = self.model.expiry_cutoff(token_type)
+        if cutoff is None:
+            return self.get_query_set().none()
+        return self.get_query_set().filter(token_type=token_type, touched__lt=cutoff)
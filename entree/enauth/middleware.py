@@ -4,6 +4,7 @@ from django.core.urlresolvers import reverse
 from django.http import HttpResponseRedirect
 from django.contrib.auth.models import AnonymousUser
 from django.conf import settings
+from django.utils.functional import SimpleLazyObject
 
 from entree.enauth.backends import AuthBackend
 
@@ -28,20 +29,33 @@ def get_user(request):
 
 
 class AuthMiddleware(object):
+
+    def __init__(self):
+        #resolved once, not on each request
+        self.logout_path = reverse('logout')
+        self.verify_path = reverse('verify_identity')
+        self.skip_paths = tuple([one for one in (settings.STATIC_URL, settings.MEDIA_URL) if one and one.startswith('/')])
+
     def process_request(self, request):
-        print 'processing request'
         assert hasattr(request, 'session'), "The Django authentication middleware requires session middleware to be installed. Edit your MIDDLEWARE_CLASSES setting to insert 'django.contrib.sessions.middleware.SessionMiddleware'."
-        user = get_user(request)
-        request.__class__.entree_user = user
+        #per request and lazy, user is loaded only when it's needed
+        request.entree_user = SimpleLazyObject(lambda: get_user(request))
+
+        if self.skip_paths and request.path.startswith(self.skip_paths):
+            return None
+
+        #anonymous request, nothing to check
+        if settings.ENTREE['SESSION_KEY'] not in request.session:
+            return None
 
         #do not allow user w/o verified go anywhere
+        user = request.entree_user
         if user.is_authenticated():
             if user.mail_verified and user.is_active:
                 return None
 
-            if request.path.startswith(reverse('logout')):
+            if request.path.startswith(self.logout_path):
                 return None
 
-            redirect_path = reverse('verify_identity')
-            if not request.path.startswith(redirect_path):
-                return HttpResponseRedirect(redirect_path)
+            if not request.path.startswith(self.verify_path):
+                return HttpResponseRedirect(self.verify_path)
@@ -0,0 +1,41 @@
+# -*- coding: utf-8 -*-
+import datetime
+from south.db import db
+from south.v2 import SchemaMigration
+from django.db import models
+
+
+class Migration(SchemaMigration):
+
+    def forwards(self, orm):
+        # Adding index on 'LoginToken', fields ['token_type', 'touched']
+        db.create_index(u'enauth_logintoken', ['token_type', 'touched'])
+
+
+    def backwards(self, orm):
+        # Removing index on 'LoginToken', fields ['token_type', 'touched']
+        db.delete_index(u'enauth_logintoken', ['token_type', 'touched'])
+
+
+    models = {
+        u'enauth.identity': {
+            'Meta': {'object_name': 'Identity'},
+            'date_joined': ('django.db.models.fields.DateTimeField', [], {'default': 'datetime.datetime.now'}),
+            'email': ('django.db.models.fields.EmailField', [], {'unique': 'True', 'max_length': '75'}),
+            u'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'is_active': ('django.db.models.fields.BooleanField', [], {'default': 'False'}),
+            'mail_verified': ('django.db.models.fields.BooleanField', [], {'default': 'False'}),
+            'password': ('django.db.models.fields.CharField', [], {'max_length': '128'})
+        },
+        u'enauth.logintoken': {
+            'Meta': {'object_name': 'LoginToken', 'index_together': "[['token_type', 'touched']]"},
+            'app_data': ('app_data.fields.AppDataField', [], {'default': "'{}'"}),
+            u'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'token_type': ('django.db.models.fields.CharField', [], {'default': "'AUTH'", 'max_length': '5', 'db_index': 'True'}),
+            'touched': ('django.db.models.fields.DateTimeField', [], {'default': 'datetime.datetime.now'}),
+            'user': ('django.db.models.fields.related.ForeignKey', [], {'to': u"orm['enauth.Identity']"}),
+            'value': ('django.db.models.fields.CharField', [], {'unique': 'True', 'max_length': '40'})
+        }
+    }
+
+    complete_apps = ['enauth']
\ No newline at end of file
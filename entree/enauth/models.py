@@ -2,20 +2,20 @@ import logging
 
 from random import randint
 from sys import maxint
-from datetime import datetime
-from cache_tools.conf import KEY_PREFIX
-from cache_tools.utils import _get_key
-from django.contrib.contenttypes.models import ContentType
+from datetime import datetime, timedelta
+from django.conf import settings
 from django.core.cache import cache
 
 from django.db import models
-from django.db.models.signals import pre_delete
+from django.db.models.query_utils import DeferredAttribute
+from django.db.models.signals import post_save, post_delete
 from django.dispatch import receiver
 from django.utils.translation import ugettext_lazy as _
-from django.contrib.auth.models import check_password
 
-from entree.enauth.managers import IdentityManager
+from entree.enauth.hashers import check_password, make_password
+from entree.enauth.managers import IdentityManager, LoginTokenManager, get_token_cache_key, get_identity_cache_key
 from entree.common.utils import calc_checksum
+from entree.enauth.tokens import signed_tokens_enabled, make_signed_token, bump_generation
 
 from app_data.fields import AppDataField
 
@@ -36,6 +36,14 @@ TOKEN_TYPES = (
 )
 DEFAULT_TOKEN = AUTH_TOKEN
 
+#lifetime of tokens in seconds, None means token never expires
+TOKEN_TTL = {
+    AUTH_TOKEN: 30 * 24 * 60 * 60,  # 30 days
+    MAIL_TOKEN: 7 * 24 * 60 * 60,  # 7 days
+    RESET_TOKEN: 24 * 60 * 60,  # 1 day
+}
+TOKEN_TTL.update(settings.ENTREE.get('TOKEN_TTL', {}))
+
 
 class LoginToken(models.Model):
     """
@@ -48,6 +56,31 @@ class LoginToken(models.Model):
 
     app_data = AppDataField(_("Extra data for token"))
 
+    objects = LoginTokenManager()
+
+    class Meta:
+        index_together = (
+            ('token_type', 'touched'),
+        )
+
+    @classmethod
+    def expiry_cutoff(cls, token_type):
+        """
+        @type token_type:   string
+        @param token_type:  type of token, should be listed in TOKEN_TYPES
+
+        @rtype:     datetime
+        @return:    tokens touched before this moment are expired, None if tokens of given type never expire
+        """
+        ttl = TOKEN_TTL.get(token_type)
+        if ttl is None:
+            return None
+        return datetime.now() - timedelta(seconds=ttl)
+
+    def is_expired(self):
+        cutoff = self.expiry_cutoff(self.token_type)
+        return cutoff is not None and self.touched < cutoff
+
 
 class Identity(models.Model):
     """
@@ -64,9 +97,28 @@ class Identity(models.Model):
     class Meta:
         verbose_name = _("User identity")
 
+    def __init__(self, *args, **kwargs):
+        super(Identity, self).__init__(*args, **kwargs)
+        self._reset_loaded_values()
+
     def __unicode__(self):
         return u"Identity %s" % self.email
 
+    def _reset_loaded_values(self):
+        """
+        Remember values as they are in DB, deferred fields are left out
+        """
+        attrs = self.__class__.__dict__
+        self._loaded_values = dict([(one.attname, getattr(self, one.attname)) for one in self._meta.fields
+                                    if not isinstance(attrs.get(one.attname), DeferredAttribute)])
+
+    def get_dirty_fields(self):
+        """
+        @return: names of fields changed since identity was loaded or saved
+        @rtype: list
+        """
+        return [name for name, value in self._loaded_values.items() if getattr(self, name) != value]
+
     def create_token(self, token_type=DEFAULT_TOKEN, app_data=None):
         """
         Helper for creating LoginToken for given Identity
@@ -83,27 +135,51 @@ class Identity(models.Model):
         if token_type not in dict(TOKEN_TYPES).keys():
             raise ValueError("Unable to create token, unknown type")
 
-        value = calc_checksum(self.email, salt=randint(0, maxint))
+        value = None
+        if token_type == AUTH_TOKEN and signed_tokens_enabled():
+            value = make_signed_token(self.pk)
+        value = value or calc_checksum(self.email, salt=randint(0, maxint))
 
-        token = LoginToken.objects.create(user=self, value=value, token_type=token_type)
+        #app_data are set before save, so the token is stored by single INSERT
+        token = LoginToken(user=self, value=value, token_type=token_type)
         if app_data:
             token.app_data = app_data
+        token.save(force_insert=True)
         return token
 
     def save(self, *args, **kwargs):
+        """
+        Existing identity is saved w/ update_fields of changed columns only, \
+        unless update_fields are given explicitly.
+        """
         self.email = self.email.strip().lower()
-        if not self.is_active:
+
+        if self.pk and not self._state.adding and not kwargs.get('force_insert') and \
+                kwargs.get('update_fields') is None:
+            kwargs['update_fields'] = self.get_dirty_fields()
+
+        update_fields = kwargs.get('update_fields')
+
+        #tokens of deactivated identity are not valid anymore
+        if self._loaded_values.get('is_active') and not self.is_active and \
+                (update_fields is None or 'is_active' in update_fields):
             LoginToken.objects.filter(token_type=AUTH_TOKEN, user=self).delete()
+
         super(Identity, self).save(*args, **kwargs)
 
+        if update_fields is None:
+            self._reset_loaded_values()
+        else:
+            for one in update_fields:
+                self._loaded_values[one] = getattr(self, one)
+
     def check_password(self, raw_password):
         def setter(raw_password):
             self.set_password(raw_password)
-            self.save()
+            self.save(update_fields=['password'])
         return check_password(raw_password, self.password, setter)
 
     def set_password(self, raw_password):
-        from django.contrib.auth.hashers import make_password
         self.password = make_password(raw_password)
 
     def is_authenticated(self):
@@ -115,11 +191,32 @@ class Identity(models.Model):
             'email': self.email,
         }
 
-@receiver(pre_delete, sender=LoginToken)
-def _signal_delete_profile_data(sender, **kwargs):
-    #TODO - cleaner
-    prop = kwargs['instance']
-    ct =ContentType.objects.get_for_model(prop)
-    key = _get_key(KEY_PREFIX, ct, value=prop.value)
-    cache.delete(key)
-    print 'deleted %s' % key
+
+@receiver(post_save, sender=LoginToken)
+@receiver(post_delete, sender=LoginToken)
+def _signal_flush_token_cache(sender, **kwargs):
+    cache.delete(get_token_cache_key(kwargs['instance'].value))
+
+
+@receiver(post_delete, sender=LoginToken)
+def _signal_revoke_signed_tokens(sender, **kwargs):
+    token = kwargs['instance']
+    if token.token_type == AUTH_TOKEN:
+        bump_generation(token.user_id)
+
+
+@receiver(post_save, sender=Identity)
+@receiver(post_delete, sender=Identity)
+def _signal_flush_identity_cache(sender, **kwargs):
+    cache.delete(get_identity_cache_key(kwargs['instance'].pk))
+
+
+@receiver(post_save, sender=Identity)
+def _signal_flush_identity_documents(sender, **kwargs):
+    from entree.host.models import SiteProfile
+
+    identity = kwargs['instance']
+    update_fields = kwargs.get('update_fields')
+    if kwargs.get('created') or (update_fields is not None and not set(update_fields) & set(identity.basic_data)):
+        return
+    SiteProfile.objects.invalidate_identity(identity.pk)
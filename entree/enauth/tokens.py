@@ -0,0 +1,222 @@
+"""
+Stateless (signed) AUTH tokens.
+
+Signed token carries identity id, time of issue and revocation generation and
+is signed by server's SECRET_KEY, so it can be verified w/o any DB query:
+
+    S + identity id (6) + issued (6) + generation (6) + nonce (5) + signature (16)
+
+numbers are uppercase base36 padded by zeros, nonce is random uppercase base36 \
+(so tokens issued in the same second differ), signature is uppercase hex.
+Each token is still stored as a LoginToken, so logout, recovery login etc. \
+works the same way as for random tokens.
+
+Revocation works via per-identity generation counter kept in cache. It is bumped \
+whenever some AUTH token of identity is deleted. Token with generation not \
+matching the cached one (or with no generation cached at all) is not refused, \
+it just falls back to LoginToken lookup.
+"""
+import logging
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.utils.crypto import salted_hmac, constant_time_compare, get_random_string
+from django.utils.http import int_to_base36, base36_to_int
+
+
+ENTREE = settings.ENTREE
+logger = logging.getLogger(__name__)
+
+SIGNED_PREFIX = 'S'
+FIELD_LENGTH = 6
+NONCE_LENGTH = 5
+NONCE_CHARS = '0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZ'
+SIGNATURE_LENGTH = 16
+SIGNED_LENGTH = len(SIGNED_PREFIX) + 3 * FIELD_LENGTH + NONCE_LENGTH + SIGNATURE_LENGTH
+EPOCH = 1356998400  # 2013-01-01, keeps timestamps short
+GENERATION_KEY = 'entree:tokengen:%s'
+GENERATION_TIMEOUT = 60 * 24 * 60 * 60  # 60 days
+HMAC_SALT = 'entree.enauth.tokens'
+
+
+def signed_tokens_enabled():
+    return ENTREE.get('SIGNED_TOKENS', False)
+
+
+def _now():
+    return int(time.time()) - EPOCH
+
+
+def _encode(number):
+    return int_to_base36(number).upper().rjust(FIELD_LENGTH, '0')
+
+
+def _sign(payload):
+    return salted_hmac(HMAC_SALT, payload).hexdigest().upper()[:SIGNATURE_LENGTH]
+
+
+def get_generation(identity_id):
+    """
+    @return: actual revocation generation of identity, None if unknown
+    @rtype: int
+    """
+    return cache.get(GENERATION_KEY % identity_id)
+
+
+def init_generation(identity_id):
+    """
+    Get actual generation, start a new one if there's none in cache.
+    New generation is based on actual time, so it never matches any older one.
+
+    @rtype: int
+    """
+    key = GENERATION_KEY % identity_id
+    generation = cache.get(key)
+    if generation is None:
+        cache.add(key, _now(), GENERATION_TIMEOUT)
+        generation = cache.get(key)
+    return generation
+
+
+def bump_generation(identity_id):
+    """
+    Revoke all signed tokens of identity issued so far
+    """
+    key = GENERATION_KEY % identity_id
+    generation = cache.get(key)
+    if generation is not None:
+        cache.set(key, max(generation + 1, _now()), GENERATION_TIMEOUT)
+
+
+def make_signed_token(identity_id):
+    """
+    @type identity_id: int
+    @param identity_id: pk of Identity the token belongs to
+
+    @rtype: str
+    @return: signed token value, None if identity id can't be encoded
+    """
+    identity_field = _encode(identity_id)
+    if len(identity_field) > FIELD_LENGTH:
+        return None
+
+    payload = "%s%s%s%s%s" % (SIGNED_PREFIX, identity_field, _encode(_now()), _encode(init_generation(identity_id)),
+        get_random_string(NONCE_LENGTH, NONCE_CHARS))
+    return payload + _sign(payload)
+
+
+def parse_signed_token(value):
+    """
+    @type value: str
+    @param value: token value
+
+    @rtype: tuple
+    @return: (identity_id, issued, generation) of signed token, \
+        None if value is not a validly signed token
+    """
+    if not value or len(value) != SIGNED_LENGTH or not value.startswith(SIGNED_PREFIX):
+        return None
+
+    payload, signature = value[:-SIGNATURE_LENGTH], value[-SIGNATURE_LENGTH:]
+    if not constant_time_compare(signature, _sign(payload)):
+        return None
+
+    fields = payload[len(SIGNED_PREFIX):-NONCE_LENGTH]
+    try:
+        return tuple(base36_to_int(fields[i:i + FIELD_LENGTH]) for i in range(0, len(fields), FIELD_LENGTH))
+    except ValueError:
+        return None
+
+
+def _is_expired(issued):
+    """
+    @param issued: time of issue of signed token (relative to EPOCH)
+    @rtype: bool
+    """
+    from entree.enauth.models import LoginToken, AUTH_TOKEN
+
+    cutoff = LoginToken.expiry_cutoff(AUTH_TOKEN)
+    return cutoff is not None and issued + EPOCH < time.mktime(cutoff.timetuple())
+
+
+def resolve_identity(value):
+    """
+    Find owner of given AUTH token.
+    Signed token w/ actual generation is resolved w/o touching LoginToken at all, \
+    others are looked up via (cached) LoginToken. Owner always comes from \
+    Identity.objects.get_cached(), flushed on each Identity save/delete.
+
+    @type value: str
+    @param value: token value
+
+    @rtype: Identity
+    @return: active owner of the token
+
+    @raise LoginToken.DoesNotExist
+    """
+    from entree.enauth.models import Identity, LoginToken, AUTH_TOKEN
+
+    identity_id = None
+    signed = parse_signed_token(value)
+    if signed:
+        if _is_expired(signed[1]):
+            raise LoginToken.DoesNotExist("Signed token is expired")
+        if signed[2] == get_generation(signed[0]):
+            identity_id = signed[0]
+
+    if identity_id is None:
+        token = LoginToken.objects.get_cached(value)
+        if token.token_type != AUTH_TOKEN or token.is_expired():
+            raise LoginToken.DoesNotExist("Token is expired")
+        identity_id = token.user_id
+
+    try:
+        identity = Identity.objects.get_cached(identity_id)
+    except Identity.DoesNotExist:
+        raise LoginToken.DoesNotExist("Owner of token doesn't exist")
+
+    if not identity.is_active:
+        raise LoginToken.DoesNotExist("Owner of token is not active")
+    return identity
+
+
+def resolve_identities(values):
+    """
+    Find owners of given AUTH tokens at once, the same rules as for \
+    resolve_identity() apply. Generations of signed tokens are read by one \
+    cache round trip, remaining tokens and owners by one query each.
+
+    @type values: list
+    @param values: token values
+
+    @rtype: dict
+    @return: active owners (Identity) by token value, invalid tokens are left out
+    """
+    from entree.enauth.models import Identity, LoginToken, AUTH_TOKEN
+
+    signed = {}
+    expired = set()
+    for value in set(values):
+        parsed = parse_signed_token(value)
+        if not parsed:
+            continue
+        if _is_expired(parsed[1]):
+            expired.add(value)
+        else:
+            signed[value] = parsed
+
+    generations = cache.get_many([GENERATION_KEY % one[0] for one in signed.values()])
+
+    owners = {}
+    for value, (identity_id, issued, generation) in signed.items():
+        if generation == generations.get(GENERATION_KEY % identity_id):
+            owners[value] = identity_id
+
+    lookup = [one for one in set(values) if one not in owners and one not in expired]
+    if lookup:
+        tokens = LoginToken.objects.valid(AUTH_TOKEN).filter(value__in=lookup)
+        owners.update(dict(tokens.values_list('value', 'user_id')))
+
+    identities = Identity.objects.filter(is_active=True).in_bulk(set(owners.values()))
+    return dict([(value, identities[one]) for value, one in owners.items() if one in identities])
@@ -2,12 +2,14 @@ from django.conf.urls import patterns, url
 from entree.enauth.views import (
     CreateIdentityView, LoginView, IdentityVerifyView, LogoutView, LoginHashView,
     IdentityVerifyResend, RecoveryLoginView, PasswordResetView, PasswordRecoveryRequestView,
-    FinishRecoveryView, PasswordChangeView, ShowApiView)
+    FinishRecoveryView, PasswordChangeView, ShowApiView, ShowApiJsonView)
 
 #TODO - cleanup
 urlpatterns = patterns('entree.enauth.views',
     url(r'^api/show/(?P<site_id>\d+)/$', ShowApiView.as_view(), name='api_show'),
     url(r'^api/show/$', ShowApiView.as_view(), name='api_show'),
+    url(r'^api/show/(?P<site_id>\d+)/json/$', ShowApiJsonView.as_view(), name='api_show_json'),
+    url(r'^api/show/json/$', ShowApiJsonView.as_view(), name='api_show_json'),
     url(r'^iframe-login/$', LoginHashView.as_view(), name='login_hash'),
 
     url(r'^login/recovery/(?P<origin_site>\d+)/$', RecoveryLoginView.as_view(), name='login-recovery'),
@@ -3,9 +3,9 @@ import logging
 import re
 
 from binascii import Error as DecodeError
+from hashlib import md5
 from urlparse import urlparse
 from base64 import b64decode
-from cache_tools.utils import get_cached_object
 
 from django.conf import settings
 from django.contrib.auth import SESSION_KEY
@@ -15,10 +15,13 @@ from django.core.urlresolvers import reverse
 from django.core.exceptions import ValidationError
 from django.core.validators import validate_email
 from django.http import HttpResponseRedirect, Http404
-from django.views.decorators.cache import never_cache
+from django.utils.decorators import method_decorator
+from django.views.decorators.cache import never_cache, cache_control
+from django.views.decorators.http import condition
 from django.views.generic.base import View, TemplateView, TemplateResponseMixin
 from django.views.generic.edit import FormView, CreateView
 from django.shortcuts import render_to_response
+from django.template.loader import render_to_string
 from django.utils.translation import ugettext_lazy as _
 from django.utils.safestring import mark_safe
 from django.template.context import RequestContext
@@ -27,15 +30,20 @@ from entree.enauth.forms import EntreeAuthForm, CreateIdentityForm, RecoveryForm
 from entree.enauth.mailer import IdentityMailer
 from entree.enauth.models import Identity, LoginToken, MAIL_TOKEN, AUTH_TOKEN, RESET_TOKEN
 from entree.enauth.middleware import CACHED_USER_KEY
+from entree.common.cache import LocalCache
 from entree.common.views import JSONResponseMixin
 from entree.common.utils import ENTREE_SAFE
 from entree.host.views import get_next_url, AuthRequiredMixin
+from entree.host.managers import SITE_NAMESPACE
 from entree.host.models import EntreeSite, SiteProfile
 
 
 ENTREE = settings.ENTREE
 logger = logging.getLogger(__name__)
 
+API_CONFIG_CACHE = LocalCache(SITE_NAMESPACE)
+LOGIN_HASH_ETAGS = LocalCache(SITE_NAMESPACE)
+
 
 class EntreeAuthMixin(TemplateResponseMixin):
     def entree_login(self, identity, site_id=None, next_url=None):
@@ -54,12 +62,7 @@ class EntreeAuthMixin(TemplateResponseMixin):
 
         #can we redirect back to origin site or do we need activate profile first?
         if site_id:
-            try:
-                active = SiteProfile.objects.get(site_id=site_id, user=identity).is_active
-            except SiteProfile.DoesNotExist:
-                active = False
-
-            if not active:
+            if not SiteProfile.objects.is_active(user=identity, site=site_id):
                 kwargs = dict(site_id=site_id)
                 if next_url:
                     kwargs.update(dict(next_url=next_url))
@@ -122,7 +125,7 @@ class LoginView(EntreeAuthMixin, FormView):
     def dispatch(self, request, *args, **kwargs):
         if not kwargs.get('origin_site'):
             try:
-                origin_site = get_cached_object(EntreeSite, is_default=True)
+                origin_site = EntreeSite.objects.get_cached(is_default=True)
             except EntreeSite.DoesNotExist:
                 raise Http404("No default client site set")
 
@@ -150,7 +153,7 @@ class LoginView(EntreeAuthMixin, FormView):
 
     def get_context_data(self, **kwargs):
         data = super(LoginView, self).get_context_data(**kwargs)
-        data['origin_site'] = get_cached_object(EntreeSite, pk=self.kwargs['origin_site'])
+        data['origin_site'] = EntreeSite.objects.get_cached(pk=self.kwargs['origin_site'])
         return data
 
     def form_valid(self, form):
@@ -168,25 +171,46 @@ class LogoutView(AuthRequiredMixin, EntreeAuthMixin, FormView):
         return self.entree_logout(next_url)
 
 
+def _login_hash_context():
+    return {
+        'domains_whitelist': EntreeSite.objects.get_whitelist()['domains'],
+        'entree': ENTREE_SAFE,
+    }
+
+
+def _login_hash_etag(request, *args, **kwargs):
+    """
+    Hash of rendered page, so any change of template or settings (not just \
+    whitelist of sites) shows up. Rendered once per process and whitelist.
+    """
+    context = _login_hash_context()
+    key = tuple(context['domains_whitelist'])
+    etag = LOGIN_HASH_ETAGS.get(key)
+    if etag is None:
+        version = LOGIN_HASH_ETAGS.get_version()
+        content = render_to_string(LoginHashView.template_name, context)
+        etag = md5(content.encode('utf-8')).hexdigest()
+        LOGIN_HASH_ETAGS.set(key, etag, version)
+    return etag
+
+
 class LoginHashView(TemplateView):
+    """
+    Page is the same for all users, it changes only w/ whitelist of sites \
+    (or deploy), so clients (and shared caches) just revalidate it
+    """
 
     template_name = 'iframe_auth.html'
 
-    @never_cache
+    @method_decorator(cache_control(public=True, max_age=0, must_revalidate=True))
+    @method_decorator(condition(etag_func=_login_hash_etag))
     def get(self, request, *args, **kwargs):
-        valid_sites = []
-        for one in EntreeSite.objects.active():
-            domain = urlparse(one.url).hostname
-            if domain:
-                valid_sites.append(domain)
+        context = _login_hash_context()
 
-        if not valid_sites:
+        if not context['domains_whitelist']:
             logger.warning("There are no active sites, users can't be logged in")
 
-        return self.render_to_response({
-            'domains_whitelist': valid_sites,
-            'entree': ENTREE_SAFE,
-        })
+        return self.render_to_response(context)
 
 
 class CreateIdentityView(EntreeAuthMixin, CreateView):
@@ -208,7 +232,7 @@ class CreateIdentityView(EntreeAuthMixin, CreateView):
 
     def get_context_data(self, **kwargs):
         data = super(CreateIdentityView, self).get_context_data(**kwargs)
-        data['origin_site'] = get_cached_object(EntreeSite, pk=self.kwargs['origin_site'])
+        data['origin_site'] = EntreeSite.objects.get_cached(pk=self.kwargs['origin_site'])
         return data
 
     def form_valid(self, form):
@@ -242,7 +266,7 @@ class IdentityVerifyView(EntreeAuthMixin, TemplateView):
 
             str_token = re.sub('[^A-Z0-9]+', '', kwargs['token'])
 
-            token = LoginToken.objects.get(user__email=email, token_type=MAIL_TOKEN, value=str_token)
+            token = LoginToken.objects.valid(MAIL_TOKEN).get(user__email=email, value=str_token)
         except (LoginToken.DoesNotExist, ValidationError, UnicodeError, DecodeError):
             return super(IdentityVerifyView, self).get(request, *args, **kwargs)
 
@@ -294,7 +318,7 @@ class RecoveryLoginView(EntreeAuthMixin, View):
         token_str = re.sub('[^A-Z0-9]+', '', token_str)
 
         try:
-            token = LoginToken.objects.get(value=token_str, token_type=AUTH_TOKEN)
+            token = LoginToken.objects.valid(AUTH_TOKEN).get(value=token_str)
         except LoginToken.DoesNotExist:
             next_url = reverse('login', kwargs={
                 'origin_site': kwargs.get('origin_site', ENTREE['DEFAULT_SITE'])
@@ -342,7 +366,7 @@ class PasswordChangeView(AuthRequiredMixin, FormView):
             .filter(user=self.request.entree_user, token_type=AUTH_TOKEN) \
             .exclude(value=actual_token).delete()
 
-        self.request.entree_user.set_password(form.cleaned_data['password'])
+        self.request.entree_user.password = form.password_hash
         self.request.entree_user.save()
 
         messages.success(self.request, _("Password successfully changes"))
@@ -368,67 +392,125 @@ class PasswordResetView(FormView):
 
             token_str = re.sub('[^A-Z0-9]+', '', token)
 
-            return LoginToken.objects.get(user__email=email, token_type=RESET_TOKEN, value=token_str)
+            return LoginToken.objects.valid(RESET_TOKEN).get(user__email=email, value=token_str)
         except (LoginToken.DoesNotExist, ValidationError, UnicodeError, DecodeError):
             logger.info("Change password form requested with invalid token")
             return False
 
     def form_valid(self, form):
         token = self.is_token_valid(**self.kwargs)
-        token.user.set_password(form.cleaned_data['password'])
-        token.user.save()
+        user = token.user
+        user.password = form.password_hash
+        user.save()
 
-        LoginToken.objects.filter(token_type=AUTH_TOKEN, user=token.user).delete()
+        LoginToken.objects.filter(token_type=AUTH_TOKEN, user=user).delete()
         token.delete()
 
         return HttpResponseRedirect(reverse('login'))
 
 
+def get_client_config(site_id=None):
+    """
+    Configuration of client site (its ENTREE settings), built once per site and \
+    ENTREE version in each process, flushed whenever some site is changed.
+
+    @param site_id: pk of EntreeSite, placeholders are used if not given
+    @type site_id: int
+
+    @return: dict w/ `html` (highlighted placeholders), `json` and its `etag`
+    @rtype: dict
+
+    @raise EntreeSite.DoesNotExist
+    """
+    key = (site_id, ENTREE['VERSION'])
+    config = API_CONFIG_CACHE.get(key)
+    if config is not None:
+        return config
+
+    version = API_CONFIG_CACHE.get_version()
+    REPLACE_STR = "REPLACE_ME"
+    REPLACE_INT = 123456789
+
+    if site_id is not None:
+        site = EntreeSite.objects.get_cached(pk=site_id)
+        SITE_ID = site.pk
+        DOMAIN = urlparse(site.url).hostname
+    else:
+        SITE_ID = REPLACE_INT
+        DOMAIN = REPLACE_STR
+
+    prepare_entree = {
+        "VERSION": ENTREE['VERSION'],
+        'URL_SERVER': ENTREE['URL_SERVER'],
+        'CACHE_PROFILE': 5*60,
+        'ROUTE': {
+            'LOGIN': reverse('login'),
+            'LOGOUT': reverse('logout'),
+            'REGISTER': reverse('register'),
+            'PROFILE': reverse('profile'),
+            'PROFILE_EDIT': reverse('profile_edit'),
+            'PROFILE_FETCH': reverse('profile_fetch'),
+            'PROFILE_FETCH_BATCH': reverse('profile_fetch_batch'),
+            'PROFILE_SEARCH': reverse('profile_search'),
+            'JS_LIB': settings.STATIC_URL + 'js/entree.js',
+        },
+        'COOKIE': {
+            'ANONYMOUS_VALUE': 'ANONYMOUS',
+            'NAME': 'entree_token',
+            'DOMAIN': DOMAIN,
+            'PATH': '/',
+            'INVALID': 'INVALID',
+        },
+        'SITE_ID': SITE_ID,
+        'SECRET_KEY': REPLACE_STR,
+    }
+
+    html = json.dumps(prepare_entree, indent=4)
+    html = html.replace(str(REPLACE_INT), '<strong>%s</strong>' % REPLACE_INT)
+    html = html.replace('"%s"' % REPLACE_STR, '<strong>%s</strong>' % REPLACE_STR)
+
+    content = json.dumps(prepare_entree, sort_keys=True)
+    config = {
+        'html': mark_safe(html),
+        'json': content,
+        'etag': md5(content).hexdigest(),
+    }
+    API_CONFIG_CACHE.set(key, config, version)
+    return config
+
+
+def _client_config_etag(request, site_id=None, *args, **kwargs):
+    try:
+        return get_client_config(site_id and int(site_id))['etag']
+    except EntreeSite.DoesNotExist:
+        return None
+
+
 class ShowApiView(TemplateView):
 
     template_name = 'api/show.html'
 
     def get_context_data(self, **kwargs):
         data = super(ShowApiView, self).get_context_data(**kwargs)
-        REPLACE_STR = "REPLACE_ME"
-        REPLACE_INT = 123456789
-
-        if 'site_id' in kwargs:
-            site = EntreeSite.objects.get(pk=int(kwargs['site_id']))
-            SITE_ID = site.pk
-            DOMAIN = urlparse(site.url).hostname
-        else:
-            SITE_ID = REPLACE_INT
-            DOMAIN = REPLACE_STR
-
-        prepare_entree = {
-            "VERSION": ENTREE['VERSION'],
-            'URL_SERVER': ENTREE['URL_SERVER'],
-            'CACHE_PROFILE': 5*60,
-            'ROUTE': {
-                'LOGIN': reverse('login'),
-                'LOGOUT': reverse('logout'),
-                'REGISTER': reverse('register'),
-                'PROFILE': reverse('profile'),
-                'PROFILE_EDIT': reverse('profile_edit'),
-                'PROFILE_FETCH': reverse('profile_fetch'),
-                'JS_LIB': settings.STATIC_URL + 'js/entree.js',
-            },
-            'COOKIE': {
-                'ANONYMOUS_VALUE': 'ANONYMOUS',
-                'NAME': 'entree_token',
-                'DOMAIN': DOMAIN,
-                'PATH': '/',
-                'INVALID': 'INVALID',
-            },
-            'SITE_ID': SITE_ID,
-            'SECRET_KEY': REPLACE_STR,
-        }
-
-        prepare_entree = json.dumps(prepare_entree, indent=4)
-        prepare_entree = prepare_entree.replace(str(REPLACE_INT), '<strong>%s</strong>' % REPLACE_INT)
-        prepare_entree = prepare_entree.replace('"%s"' % REPLACE_STR, '<strong>%s</strong>' % REPLACE_STR)
-
-        data['ENTREE'] = mark_safe(prepare_entree)
+        try:
+            config = get_client_config(kwargs.get('site_id') and int(kwargs['site_id']))
+        except EntreeSite.DoesNotExist:
+            raise Http404(_("Requested site doesn't exist"))
 
+        data['ENTREE'] = config['html']
         return data
+
+
+class ShowApiJsonView(JSONResponseMixin, View):
+    """
+    Machine-readable variant of ShowApiView, clients can revalidate it via ETag
+    """
+
+    @method_decorator(condition(etag_func=_client_config_etag))
+    def get(self, request, *args, **kwargs):
+        try:
+            config = get_client_config(kwargs.get('site_id') and int(kwargs['site_id']))
+        except EntreeSite.DoesNotExist:
+            raise Http404(_("Requested site doesn't exist"))
+
+        return self.get_json_response(config['json'])
@@ -0,0 +1,120 @@
+"""
+Management utility to export profiles of Entree site
+"""
+import csv
+import time
+
+import simplejson as json
+
+from optparse import make_option
+
+from django.core.management.base import CommandError, BaseCommand
+from django.db.utils import DEFAULT_DB_ALIAS
+
+from entree.enauth.models import Identity
+from entree.host.models import EntreeSite, SiteProfile
+from entree.host.profiles.models import SiteProperty
+
+
+FORMATS = ('csv', 'jsonl')
+
+
+class Command(BaseCommand):
+    option_list = BaseCommand.option_list + (
+            make_option('--site', action='store', type='int', dest='site_id', default=None,
+                help='Id of EntreeSite whose profiles are exported.'),
+            make_option('--format', action='store', dest='format', default='csv',
+                help='Output format, one of: %s. Default is csv.' % ', '.join(FORMATS)),
+            make_option('--output', action='store', dest='output', default=None,
+                help='File to write profiles into. Default is standard output.'),
+            make_option('--chunk-size', action='store', type='int', dest='chunk_size', default=1000,
+                help='Number of profiles loaded at once. Default is 1000.'),
+            make_option('--database', action='store', dest='database',
+                default=DEFAULT_DB_ALIAS, help='Specifies the database to use. Default is "default".'),
+        )
+
+    help = 'Export active profiles of given site (incl. resident data) as CSV or JSON Lines.'
+
+    def handle(self, *args, **options):
+        output_format = options.get('format')
+        chunk_size = options.get('chunk_size')
+        verbosity = int(options.get('verbosity', 1))
+        database = options.get('database')
+
+        if output_format not in FORMATS:
+            raise CommandError("Unknown format: %s" % output_format)
+
+        if chunk_size < 1:
+            raise CommandError("Chunk size has to be positive number")
+
+        try:
+            site = EntreeSite.objects.db_manager(database).get(pk=options.get('site_id'))
+        except EntreeSite.DoesNotExist:
+            raise CommandError("You must provide --site with id of existing EntreeSite")
+
+        slugs = [one.slug for one in SiteProperty.objects.get_site_props(site=site)]
+        fields = ['id', 'email'] + slugs
+
+        output = open(options['output'], 'wb') if options.get('output') else self.stdout
+        try:
+            if output_format == 'csv':
+                writer = csv.writer(output)
+                writer.writerow(fields)
+                write = lambda row: writer.writerow([unicode(row.get(one, '')).encode('utf-8') for one in fields])
+            else:
+                write = lambda row: output.write(json.dumps(row) + "\n")
+
+            started = time.time()
+            exported = 0
+            for chunk in self.iter_profiles(site, chunk_size, database):
+                for row in chunk:
+                    write(row)
+
+                exported += len(chunk)
+                if verbosity > 1:
+                    self.report(exported, started)
+        finally:
+            if output is not self.stdout:
+                output.close()
+
+        if verbosity:
+            self.report(exported, started)
+
+    def iter_profiles(self, site, chunk_size, database):
+        """
+        Yield merged profiles of active site's users, `chunk_size` at once.
+        Chunks are iterated by identity id (keyset), so memory usage and cost \
+        of each chunk is constant, no matter how many profiles were exported so far.
+
+        @rtype: generator
+        @return: lists of dicts w/ identity id, email and all property values
+        """
+        profiles = SiteProfile.objects.db_manager(database).filter(site=site, is_active=True)
+
+        last_id = 0
+        while True:
+            user_ids = list(profiles.filter(user__gt=last_id).order_by('user').values_list('user_id', flat=True)[:chunk_size])
+            if not user_ids:
+                break
+
+            users = Identity.objects.db_manager(database).in_bulk(user_ids)
+            data = SiteProfile.objects.db_manager(database).get_data_many(users=users.values(), site=site)
+
+            chunk = []
+            for user_id in user_ids:
+                if user_id not in users:
+                    continue
+                row = data[user_id]
+                row.pop('is_active', None)
+                row.update({'id': user_id, 'email': users[user_id].email})
+                chunk.append(row)
+            yield chunk
+
+            if len(user_ids) < chunk_size:
+                break
+            last_id = user_ids[-1]
+
+    def report(self, exported, started):
+        elapsed = time.time() - started
+        rate = exported / elapsed if elapsed else 0
+        self.stderr.write("%s profiles exported in %.1fs (%.0f profiles/s)" % (exported, elapsed, rate))
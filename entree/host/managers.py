@@ -1,22 +1,183 @@
 import logging
+import threading
+import time
+
+from urlparse import urlparse
 
 from django.conf import settings
 from django.core.cache import cache
 from django.db import models
+from django.db.models import Count, Max
+from django.db.models.query import QuerySet
 
-from cache_tools.utils import get_cached_object
+from entree.common.cache import LocalCache
 
 
 logger = logging.getLogger(__name__)
-NOSITE_ID = settings.ENTREE['NOSITE_ID']
+ENTREE = settings.ENTREE
+NOSITE_ID = ENTREE['NOSITE_ID']
+SITE_NAMESPACE = 'sites'
+SITEPROPS_NAMESPACE = 'siteprops'
+SITEPROPS_CACHE_KEY = 'entree:siteprops:%s:%s'
+SITEPROPS_FIELDS = ('id', 'name', 'slug', 'site_id', 'value_type', 'is_required', 'is_unique')
+REGISTRY_LOOKUPS = ('pk', 'hostname', 'is_default')
+
+
+class SiteRegistry(object):
+    """
+    All EntreeSites held in process memory, indexed by pk, hostname and default flag.
+
+    Registry is reloaded when
+     - version of sites' cache namespace moves (on each EntreeSite save/delete \
+       and queryset update, noticed by other processes in \
+       ENTREE['LOCAL_CACHE_CHECK'] seconds)
+     - change stamp in DB (latest `modified` and number of sites) moves, it's \
+       checked once per ENTREE['SITE_REGISTRY_CHECK'] seconds, so sites added, \
+       removed or touched (w/ `modified` set) outside of ORM are picked up too
+    """
+
+    def __init__(self, manager, check_interval=None):
+        self.manager = manager
+        self.check_interval = check_interval if check_interval is not None else ENTREE.get('SITE_REGISTRY_CHECK', 60)
+
+        self._lock = threading.Lock()
+        self._index = None
+        self._version = None
+        self._checked = 0
+
+    def get_stamp(self):
+        stamp = self.manager.get_query_set().aggregate(modified=Max('modified'), count=Count('pk'))
+        return stamp['modified'], stamp['count']
+
+    def get_index(self):
+        """
+        @return: actual index of sites, reloaded if needed
+        @rtype: dict
+        """
+        version = self.manager.local_cache.get_version()
+        index = self._index
+        if index is None or version != self._version:
+            return self.load(version)
+
+        now = time.time()
+        if now - self._checked >= self.check_interval:
+            self._checked = now
+            if self.get_stamp() != index['stamp']:
+                return self.load(version)
+
+        return index
+
+    def load(self, version):
+        sites = list(self.manager.get_query_set().order_by('pk'))
+
+        index = {
+            'pk': {},
+            'hostname': {},
+            'is_default': {},
+            'whitelist': [],
+            'stamp': (max([one.modified for one in sites]) if sites else None, len(sites)),
+        }
+        for one in sites:
+            hostname = urlparse(one.url).hostname
+            index['pk'][one.pk] = one
+            if hostname:
+                index['hostname'].setdefault(hostname, one)
+            if one.is_default is not None:
+                index['is_default'][one.is_default] = one
+            if hostname and one.is_active and one.pk != NOSITE_ID:
+                index['whitelist'].append(hostname)
+
+        with self._lock:
+            self._index = index
+            self._version = version
+            self._checked = time.time()
+        return index
+
+    def get(self, **lookup):
+        """
+        @param lookup: one of pk, hostname or is_default
+        @type lookup: dict
+
+        @rtype: EntreeSite
+        @raise EntreeSite.DoesNotExist
+        """
+        (name, value), = lookup.items()
+        if name not in REGISTRY_LOOKUPS:
+            raise ValueError("Sites can't be looked up by %s" % name)
+        if name == 'pk':
+            try:
+                value = int(value)
+            except (TypeError, ValueError):
+                raise self.manager.model.DoesNotExist("Invalid site id")
+
+        try:
+            return self.get_index()[name][value]
+        except KeyError:
+            raise self.manager.model.DoesNotExist("Site matching %s=%s does not exist" % (name, value))
+
+
+class EntreeSiteQuerySet(QuerySet):
+    def update(self, **kwargs):
+        """
+        Updates bypass signals, so sites are flushed here
+        """
+        rows = super(EntreeSiteQuerySet, self).update(**kwargs)
+        self.model.objects.invalidate()
+        return rows
 
 
 class EntreeSiteManager(models.Manager):
+    local_cache = LocalCache(SITE_NAMESPACE)
+
+    def get_query_set(self):
+        return EntreeSiteQuerySet(self.model, using=self._db)
+
     def active(self):
         return self.get_query_set().filter(is_active=True).exclude(pk=NOSITE_ID)
 
+    @property
+    def registry(self):
+        if getattr(self, '_registry', None) is None:
+            self._registry = SiteRegistry(self)
+        return self._registry
+
+    def get_cached(self, **lookup):
+        """
+        Get site from in-memory registry.
+        Returned instance is shared, don't modify it.
+
+        @param lookup: one of pk, hostname or is_default, ie. pk=1 or is_default=True
+        @type lookup: dict
+
+        @rtype: EntreeSite
+        @raise EntreeSite.DoesNotExist
+        """
+        return self.registry.get(**lookup)
+
+    def get_whitelist(self):
+        """
+        Hostnames of active sites, taken from site registry.
+
+        @return: dict w/ `domains` list and `modified` time of the latest site change
+        @rtype: dict
+        """
+        index = self.registry.get_index()
+        modified = index['stamp'][0]
+        return {
+            'domains': index['whitelist'],
+            'modified': int(time.mktime(modified.timetuple())) if modified else 0,
+        }
+
+    def invalidate(self):
+        """
+        Flush cached sites in all processes
+        """
+        self.local_cache.invalidate()
+
 
 class SitePropertyManager(models.Manager):
+    local_cache = LocalCache(SITEPROPS_NAMESPACE)
+
     def get_site_props(self, site=None, cascade=True):
         """
         @type site:  EntreeSite
@@ -27,21 +188,63 @@ class SitePropertyManager(models.Manager):
         @rtype list
         @return list of SiteProperty items according to site_id given on input
         """
-        from entree.host.models import EntreeSite
-
-        site = site or get_cached_object(EntreeSite, pk=NOSITE_ID)
+        site_id = site.pk if site else NOSITE_ID
 
-        if cascade and site.pk != NOSITE_ID:
-            resident_props = self.get_site_props(cascade=False)
-        else:
-            resident_props = []
+        site_ids = [site_id]
+        if cascade and site_id != NOSITE_ID:
+            site_ids.append(NOSITE_ID)
 
-        site_props = self.get_data(site.pk)
-        return site_props + resident_props
+        schemas = self.get_schemas(site_ids)
+        return sum([schemas[one] for one in site_ids], [])
 
     def get_data(self, key):
-        data = cache.get('siteprops:%s' % key)
-        if data is None:
-            data = list(self.get_query_set().filter(site_id=key))
-            cache.set(key, data)
-        return data
+        return self.get_schemas([key])[key]
+
+    def get_schemas(self, site_ids):
+        """
+        Load properties of all given sites. Process-local cache is asked first, \
+        then all sites missing there are obtained from shared cache at once.
+        Shared cache stores plain values, not pickled model instances.
+
+        @type site_ids: list
+        @param site_ids: pks of EntreeSites
+
+        @rtype dict
+        @return list of SiteProperty items for each of given site_ids
+        """
+        schemas = {}
+        for one in site_ids:
+            props = self.local_cache.get(one)
+            if props is not None:
+                schemas[one] = list(props)
+
+        missing = [one for one in site_ids if one not in schemas]
+        if not missing:
+            return schemas
+
+        version = self.local_cache.get_version()
+        keys = dict([(SITEPROPS_CACHE_KEY % (version, one), one) for one in missing])
+
+        rows = dict([(keys[key], val) for key, val in cache.get_many(keys.keys()).items()])
+
+        not_cached = [one for one in missing if one not in rows]
+        if not_cached:
+            for one in not_cached:
+                rows[one] = []
+            for one in self.get_query_set().filter(site__in=not_cached).order_by('pk').values(*SITEPROPS_FIELDS):
+                rows[one['site_id']].append(one)
+
+            cache.set_many(dict([(SITEPROPS_CACHE_KEY % (version, one), rows[one]) for one in not_cached]))
+
+        for site_id, items in rows.items():
+            props = [self.model(**one) for one in items]
+            self.local_cache.set(site_id, props, version)
+            schemas[site_id] = list(props)
+
+        return schemas
+
+    def invalidate(self):
+        """
+        Flush cached properties of all sites in all processes
+        """
+        self.local_cache.invalidate()
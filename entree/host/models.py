@@ -1,5 +1,7 @@
 from django.conf import settings
 from django.db import models
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
 from django.utils.translation import ugettext_lazy as _
 
 from entree.host.managers import EntreeSiteManager
@@ -18,6 +20,7 @@ class EntreeSite(models.Model):
                 _("Designates whether this site should be treated as active."))
     secret = models.CharField(_("Site secret key"), max_length=40)
     is_default = models.NullBooleanField(_("is default site"), unique=True)
+    modified = models.DateTimeField(_("Last change"), auto_now=True, editable=False)
 
     objects = EntreeSiteManager()
 
@@ -29,6 +32,8 @@ class SiteProfile(models.Model):
     user = CachedForeignKey('enauth.Identity')
     site = CachedForeignKey("host.EntreeSite")
     is_active = models.BooleanField(_("Is active"), default=False)
+    version = models.PositiveIntegerField(_("Version"), default=0, editable=False, help_text=_(
+        "Raised on each change of profile's data or activation"))
 
     objects = SiteProfileManager()
 
@@ -40,3 +45,33 @@ class SiteProfile(models.Model):
     def __unicode__(self):
         return u"<SiteProfile: %s at %s>" % (self.user, self.site)
 
+    def save(self, *args, **kwargs):
+        """
+        Version is never written from (possibly stale) instance, it's raised \
+        in DB by SiteProfileManager.bump_version() for existing profile.
+        """
+        if self.pk is None or kwargs.get('force_insert'):
+            return super(SiteProfile, self).save(*args, **kwargs)
+
+        update_fields = kwargs.get('update_fields')
+        if update_fields is None:
+            update_fields = [one.name for one in self._meta.fields if not one.primary_key]
+        kwargs['update_fields'] = [one for one in update_fields if one != 'version']
+
+        #raised before the row is written, cache flushed on post_save sees it already
+        SiteProfile.objects.bump_version(pk=self.pk)
+        super(SiteProfile, self).save(*args, **kwargs)
+
+
+@receiver(post_save, sender=SiteProfile)
+@receiver(post_delete, sender=SiteProfile)
+def _signal_flush_profile_cache(sender, **kwargs):
+    profile = kwargs['instance']
+    SiteProfile.objects.invalidate(profile.user_id, profile.site_id)
+    SiteProfile.objects.invalidate_document(profile.user_id, profile.site_id)
+
+
+@receiver(post_save, sender=EntreeSite)
+@receiver(post_delete, sender=EntreeSite)
+def _signal_flush_site_cache(sender, **kwargs):
+    EntreeSite.objects.invalidate()
@@ -1,5 +1,3 @@
-from cache_tools.utils import get_cached_object
-
 from django.conf import settings
 from django.contrib import admin
 from django.forms import BaseInlineFormSet
@@ -12,7 +10,7 @@ from entree.host.profiles.models import SiteProperty
 class ResidentBlahFormSet(BaseInlineFormSet):
     def __init__(self, *args, **kwargs):
         try:
-            kwargs['instance'] = get_cached_object(EntreeSite, pk=settings.ENTREE['NOSITE_ID'])
+            kwargs['instance'] = EntreeSite.objects.get_cached(pk=settings.ENTREE['NOSITE_ID'])
         except EntreeSite.DoesNotExist:
             kwargs['instance'] = None
         super(ResidentBlahFormSet, self).__init__(*args, **kwargs)
@@ -35,7 +33,7 @@ class ResidentSitePropertiesAdmin(admin.TabularInline):
 
     def get_formset(self, request, obj=None, **kwargs):
         try:
-            obj = get_cached_object(EntreeSite, pk=settings.ENTREE['NOSITE_ID'])
+            obj = EntreeSite.objects.get_cached(pk=settings.ENTREE['NOSITE_ID'])
         except EntreeSite.DoesNotExist:
             pass
         return super(ResidentSitePropertiesAdmin, self).get_formset(request, obj, **kwargs)
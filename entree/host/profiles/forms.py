@@ -3,6 +3,7 @@ from django.db import IntegrityError, transaction
 from django.utils.translation import ugettext_lazy as _
 
 from entree.host.models import SiteProfile
+from entree.host.profiles.models import SiteProperty, ProfileData, ProfileDataUnique, ProfileBigData
 
 
 #TODO - highlight resident properties in form!
@@ -45,7 +46,6 @@ class ProfileForm(forms.Form):
     @property
     def site_properties(self):
         if self._site_properties is None:
-            #TODO - get from cache
             site_props = SiteProperty.objects.get_site_props(site=self.site)
             self._site_properties = dict([(one.slug, one) for one in site_props])
         return self._site_properties
@@ -67,42 +67,51 @@ class ProfileForm(forms.Form):
 
             self.fields[one.slug] = field_instance
 
-    @transaction.commit_manually
     def clean(self):
         """
         Try to save data into DB.
-        If we get some error, rollback and show form w/ errors
+        Values conflicting w/ other users' ones are not saved, they're shown as form errors
 
         @return: cleaned form's data
         @rtype: dict
         """
         data = self.cleaned_data
+        self.save_profile(data)
+
+        #caches are refreshed once data are committed, so concurrent readers
+        #can't store uncommitted (or rolled back) data there
+        SiteProfile.objects.invalidate(self.user.pk, self.site.pk)
+        SiteProfile.objects.rebuild_documents(self.user)
+
+        return data
 
-        for key, val in self.fields.items():
-            try:
-                self.upsert_item(key, data.get(key))
-            except IntegrityError:
+    @transaction.commit_manually
+    def save_profile(self, data):
+        """
+        Save data, activate profile and raise its version in single transaction
+        """
+        try:
+            for key in self.save_items(data):
                 self._errors[key] = self.error_class([unicode( _("Given value already taken by some other user, use different value.")) ])
                 if key in self.cleaned_data:
                     del self.cleaned_data[key]
-                transaction.rollback()
 
-        profile, created = SiteProfile.objects.get_or_create(
-            site=self.site,
-            user=self.user,
-            defaults={'is_active': True})
+            profile, created = SiteProfile.objects.get_or_create(
+                site=self.site,
+                user=self.user,
+                defaults={'is_active': True})
 
-        if not profile.is_active:
-            profile.is_active = True
-            profile.save()
-        elif not created:
-            #updating, delete from cache
-            #TODO - flush cache only
-            SiteProfile.objects.get_cached(dict(user=profile.user, site=profile.site), recache=True)
+            if not profile.is_active:
+                profile.is_active = True
+                profile.save()
 
-        transaction.commit()
+            #resident data are part of all user's profiles
+            SiteProfile.objects.bump_version(user=self.user)
+        except:
+            transaction.rollback()
+            raise
 
-        return data
+        transaction.commit()
 
     @property
     def existing_data(self):
@@ -122,30 +131,98 @@ class ProfileForm(forms.Form):
             self._existing_data = dict([(one.site_property.slug, one) for one in tmp_data])
         return self._existing_data
 
-    def upsert_item(self, key, value):
+    def save_items(self, data):
+        """
+        Save or update all items from form into DB with as few statements as possible:
+        unchanged values are skipped, new rows are inserted at once and rows \
+        sharing the same new value are updated at once.
+
+        @param data: cleaned form's data
+        @type data: dict
+        @return: slugs of properties whose values are already taken by other users
+        @rtype: list
         """
-        Save or update one item from form into DB.
-        It can eventually raise IntegrityError
+        big_ids = [one.value_big_id for one in self.existing_data.values() if getattr(one, 'value_big_id', None)]
+        big_values = ProfileBigData.objects.in_bulk(big_ids) if big_ids else {}
+        big_length = ProfileData._meta.get_field('value_str').max_length
+
+        inserts = {}
+        updates = {}
+        for key, site_prop in self.site_properties.items():
+            if key not in data:
+                continue
+
+            value = data[key]
+            row = self.existing_data.get(key)
+            if row is not None:
+                DataClass = row.__class__
+            elif site_prop.is_unique:
+                DataClass = ProfileDataUnique
+            else:
+                DataClass = ProfileData
+
+            columns = DataClass.get_columns(value, site_prop.value_type)
+
+            #long strings live in ProfileBigData, once there, value stays there
+            if DataClass is ProfileData and columns['value_str'] is not None:
+                big = row is not None and big_values.get(row.value_big_id)
+                if big:
+                    if big.value != value:
+                        ProfileBigData.objects.filter(pk=big.pk).update(value=value)
+                    continue
+                if len(value) > big_length:
+                    columns['value_str'] = None
+                    columns['value_big_id'] = ProfileBigData.objects.create(value=value).pk
+
+            if row is None:
+                inserts.setdefault(DataClass, []).append((key, DataClass(site_property=site_prop, user=self.user, **columns)))
+            elif any(not self._same_value(getattr(row, name), val) for name, val in columns.items()):
+                group = (DataClass, tuple(sorted(columns.items())))
+                updates.setdefault(group, []).append((key, row.pk))
+
+        conflicts = []
+        for DataClass, items in inserts.items():
+            write = lambda batch, DataClass=DataClass: DataClass.objects.bulk_create([obj for key, obj in batch])
+            conflicts += self._write_batch(items, write)
+
+        for (DataClass, columns), items in updates.items():
+            write = lambda batch, DataClass=DataClass, columns=dict(columns): \
+                DataClass.objects.filter(pk__in=[pk for key, pk in batch]).update(**columns)
+            conflicts += self._write_batch(items, write)
 
-        @param key: slug of profile property
-        @type key: str
-        @param value: value of profile property
-        @type value: str
+        self._existing_data = None
+        return conflicts
 
-        @raise IntegrityError
+    def _write_batch(self, items, write):
+        """
+        Write all items at once in a savepoint. If it breaks some unique \
+        constraint, write them one by one to find out which ones are conflicting.
+
+        @param items: (slug, payload) pairs
+        @type items: list
+        @param write: callable writing list of items into DB
+        @type write: callable
+        @return: slugs of conflicting items
+        @rtype: list
         """
-        if key in 'dummy_is_activated':
-            return
-
-        site_prop = self.site_properties[key]
-        if site_prop.is_unique:
-            DataClass = ProfileDataUnique
-        else:
-            DataClass = ProfileData
-
-        #site has property & property already exists - update
-        if key in self.existing_data:
-            self.existing_data[key].set_value(value, type_hint=site_prop.value_type)
-        else:
-            profile_data = DataClass(site_property=site_prop, user=self.user)
-            profile_data.set_value(value)
+        sid = transaction.savepoint()
+        try:
+            write(items)
+        except IntegrityError:
+            transaction.savepoint_rollback(sid)
+            if len(items) == 1:
+                return [items[0][0]]
+
+            conflicts = []
+            for one in items:
+                conflicts += self._write_batch([one], write)
+            return conflicts
+
+        transaction.savepoint_commit(sid)
+        return []
+
+    @staticmethod
+    def _same_value(old, new):
+        if old is None or new is None:
+            return old is new
+        return unicode(old) == unicode(new)
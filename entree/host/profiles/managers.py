@@ -1,69 +1,356 @@
-from cache_tools.utils import get_cached_object
+import simplejson as json
 
 from django.db import models
+from django.db.models import F
 from django.conf import settings
 from django.core.cache import cache
 
+from entree.common.cache import CacheStats, LocalCache, get_namespace_version, bump_namespace_version
+from entree.host.managers import SitePropertyManager
 
-NOSITE_ID = settings.ENTREE['NOSITE_ID']
+
+ENTREE = settings.ENTREE
+NOSITE_ID = ENTREE['NOSITE_ID']
+PROFILE_CACHE_KEY = 'entree:profile:%s:%s:%s'
+PROFILE_NAMESPACE = 'profile:%s'
+ACTIVE_CACHE_KEY = 'entree:profileactive:%s:%s'
+DOCUMENT_CACHE_KEY = 'entree:profiledoc:%s:%s:%s'
+DOCUMENT_NAMESPACE = 'profiledoc'
 
 
 class SiteProfileManager(models.Manager):
+    cache_stats = CacheStats('profile')
+    document_stats = CacheStats('profiledoc')
+    #used only for rate-limited version checks, documents are kept in shared cache
+    document_namespace = LocalCache(DOCUMENT_NAMESPACE, max_size=0)
+
     #TODO move into ProfileData
     def get_data(self, user, site=None, cascade=True, override_inactive=False):
         """
         cascade - obtain resident data as well
         override_inactive - obtain data even if profile is not active
+
+        Read only - missing profile is treated as inactive, it's created \
+        when user activates it (see ProfileForm)
         """
         from entree.host.models import EntreeSite
 
-        site = site or get_cached_object(EntreeSite, pk=NOSITE_ID)
+        site = site or EntreeSite.objects.get_cached(pk=NOSITE_ID)
 
-        profile, created = self.get_or_create(
-            user=user, site=site,
-            defaults={'is_active': False})
-
-        if not profile.is_active and not override_inactive:
+        is_active = self.is_active(user=user, site=site)
+        if not is_active and not override_inactive:
             return {'is_active': False}
 
-        #obtain resident profile's data?
+        #resident profile's data are loaded in the same pass
+        site_ids = [site.pk]
         if cascade and site.pk != NOSITE_ID:
-            generic_data = self.get_data(override_inactive=True, user=user)
-        else:
-            generic_data = {}
+            site_ids.insert(0, NOSITE_ID)
+
+        sites_data = self.get_cached_many(user, site_ids)
+
+        data = {}
+        for one in site_ids:
+            data.update(sites_data[one])
+        data['is_active'] = is_active
+
+        return data
+
+    def is_active(self, user, site):
+        """
+        Cached, flushed together w/ profile data by invalidate()
+
+        @param site: EntreeSite or its pk
+        @return: True if user has activated profile for given site
+        @rtype: bool
+        """
+        site_id = int(getattr(site, 'pk', site))
+        key = ACTIVE_CACHE_KEY % (user.pk, site_id)
+        active = cache.get(key)
+        if active is None:
+            active = self.filter(user=user, site=site_id, is_active=True).exists()
+            cache.set(key, active, ENTREE.get('CACHE_PROFILE', 5 * 60))
+        return active
 
-        site_data = self.get_cached(dict(user=user, site=site))
-        site_data['is_active'] = profile.is_active
-        generic_data.update(site_data)
+    def get_version(self, user, site):
+        """
+        @return: version of user's profile for given site, 0 if there's no profile yet
+        @rtype: int
+        """
+        versions = self.filter(user=user, site=site).values_list('version', flat=True)
+        return versions[0] if versions else 0
+
+    def bump_version(self, **filters):
+        """
+        Mark profiles matching given filters as changed
+        """
+        self.filter(**filters).update(version=F('version') + 1)
+
+    def get_document_version(self, user, site):
+        """
+        Version of profile document - changes w/ the profile itself as well as \
+        w/ schema (properties of sites), w/o touching profile rows on schema change
 
-        return generic_data
+        @rtype: str
+        """
+        schema_version = SitePropertyManager.local_cache.get_version()
+        return "%s.%s" % (self.get_version(user=user, site=site), schema_version)
 
-    def get_cached(self, key, recache=True):
+    def get_cached(self, key, recache=False):
         """
+        Site-specific part of profile data, read-through cached.
+        Cache is flushed by invalidate() or for whole site by invalidate_site()
 
         @param key: dict with models (user, site) to define cache key
         @type key: dict
+        @param recache: ignore cached data and load them again
+        @type recache: bool
 
         @return: cached data for SiteProfile
         @rtype: dict
         """
-        hash_key = "%s:%s" % (key['user'].pk, key['site'].pk)
-        data = cache.get(hash_key)
-        if data is None or recache:
-            from entree.host.profiles.models import ProfileData, ProfileDataUnique, SiteProperty
+        return self.get_cached_many(key['user'], [key['site'].pk], recache=recache)[key['site'].pk]
+
+    def get_cached_many(self, user, site_ids, recache=False):
+        """
+        Site-specific parts of user's profile data for several sites at once.
+        Sites missing in cache are loaded in one pass, i.e. one query per \
+        storage table for all of them.
+
+        @param user: identity whose data are requested
+        @type user: Identity
+        @param site_ids: pks of EntreeSites
+        @type site_ids: list
+        @param recache: ignore cached data and load them again
+        @type recache: bool
+
+        @return: cached data for each of site_ids
+        @rtype: dict
+        """
+        keys = dict([(self._get_cache_key(user.pk, one), one) for one in site_ids])
+        cached = {} if recache else cache.get_many(keys.keys())
+        data = dict([(keys[key], val) for key, val in cached.items()])
+
+        missing = [one for one in site_ids if one not in data]
+        for one in site_ids:
+            if one in missing:
+                self.cache_stats.miss()
+            else:
+                self.cache_stats.hit()
+
+        if not missing:
+            return data
+
+        from entree.host.profiles.models import SiteProperty
+
+        schemas = SiteProperty.objects.get_schemas(missing)
+        values = self._load_values([user.pk], sum(schemas.values(), []))[user.pk]
+
+        for site_id in missing:
+            data[site_id] = dict([(one.slug, values[one.slug]) for one in schemas[site_id]])
+
+        cache.set_many(dict([(key, data[site_id]) for key, site_id in keys.items() if site_id in missing]),
+                       ENTREE.get('CACHE_PROFILE', 5 * 60))
+        return data
+
+    def invalidate(self, user_id, site_id=None):
+        """
+        Flush cached data of user's profile for given site and resident profile
+
+        @type user_id: int
+        @type site_id: int
+        """
+        site_ids = set([NOSITE_ID, site_id or NOSITE_ID])
+        keys = [self._get_cache_key(user_id, one) for one in site_ids]
+        keys.extend([ACTIVE_CACHE_KEY % (user_id, one) for one in site_ids])
+        cache.delete_many(keys)
+
+    def invalidate_site(self, site_id):
+        """
+        Flush cached profile data of all users for given site
+        """
+        bump_namespace_version(PROFILE_NAMESPACE % site_id)
+
+    def _get_cache_key(self, user_id, site_id):
+        return PROFILE_CACHE_KEY % (site_id, get_namespace_version(PROFILE_NAMESPACE % site_id), user_id)
+
+    def get_document(self, user, site):
+        """
+        Merged profile of user for given site (incl. resident and basic data), \
+        serialized into JSON. Document is rebuilt by ProfileForm, so reading it is \
+        just a single cache lookup.
+
+        @param user: identity whose profile is requested
+        @type user: Identity
+        @param site: site to which profile belongs to
+        @type site: EntreeSite
+
+        @return: dict w/ profile `version` and serialized `content`
+        @rtype: dict
+        """
+        document = cache.get(self._get_document_key(user.pk, site.pk))
+        if document is not None:
+            self.document_stats.hit()
+            return document
 
-            props = SiteProperty.objects.get_site_props(site=key['site'], cascade=False)
+        self.document_stats.miss()
+        return self.build_document(user, site)
 
-            data_items = list(ProfileData.objects.filter(site_property__in=props, user=key['user'])) + \
-                         list(ProfileDataUnique.objects.filter(site_property__in=props, user=key['user']))
+    def build_document(self, user, site):
+        """
+        Assemble profile document from DB and store it into cache
+
+        @rtype: dict
+        """
+        #version is read first, so document never carries version newer than its data
+        version = self.get_document_version(user=user, site=site)
+        data = self.get_data(user=user, site=site)
+        data.update(user.basic_data)
+
+        document = {
+            'version': version,
+            'content': json.dumps(data),
+        }
+        cache.set(self._get_document_key(user.pk, site.pk), document, ENTREE.get('CACHE_PROFILE', 5 * 60))
+        return document
+
+    def rebuild_documents(self, user):
+        """
+        Rebuild documents of all user's profiles, resident data are part of each of them
+        """
+        for profile in self.filter(user=user).select_related('site'):
+            self.build_document(user, profile.site)
+
+    def invalidate_document(self, user_id, site_id):
+        cache.delete(self._get_document_key(user_id, site_id))
+
+    def invalidate_identity(self, user_id):
+        """
+        Basic data of identity are part of all its documents - raise versions \
+        of all its profiles and flush their documents
+        """
+        self.bump_version(user=user_id)
+        site_ids = self.filter(user=user_id).values_list('site_id', flat=True)
+        cache.delete_many([self._get_document_key(user_id, one) for one in site_ids])
+
+    def invalidate_documents(self):
+        """
+        Flush documents of all profiles, e.g. when some site's schema changes
+        """
+        self.document_namespace.invalidate()
+
+    def _get_document_key(self, user_id, site_id):
+        return DOCUMENT_CACHE_KEY % (self.document_namespace.get_version(), site_id, user_id)
+
+    def get_data_many(self, users, site=None, cascade=True, override_inactive=False):
+        """
+        Set-based variant of get_data() - load profiles of many users at once.
+        Missing SiteProfile is treated as inactive one, nothing is created.
+
+        @param users: identities whose profiles are requested
+        @type users: list
+        @param site: site to which profiles belong to
+        @type site: EntreeSite
+
+        @return: profile data for each user, keyed by user's pk
+        @rtype: dict
+        """
+        from entree.host.models import EntreeSite
+        from entree.host.profiles.models import SiteProperty
+
+        site = site or EntreeSite.objects.get_cached(pk=NOSITE_ID)
+        user_ids = [one.pk for one in users]
 
-            data = {}
-            for one in data_items:
-                data[one.site_property.slug] = one.value
+        active = dict(self.filter(user__in=user_ids, site=site).values_list('user_id', 'is_active'))
+        if not override_inactive:
+            user_ids = [one for one in user_ids if active.get(one)]
 
-            for one in props:
-                if one.slug not in data:
-                    data[one.slug] = ""
+        props = SiteProperty.objects.get_site_props(site=site, cascade=cascade)
+        values = self._load_values(user_ids, props)
+
+        data = {}
+        for one in users:
+            if one.pk in user_ids:
+                data[one.pk] = values[one.pk]
+                data[one.pk]['is_active'] = active.get(one.pk, False)
+            else:
+                data[one.pk] = {'is_active': False}
 
-            cache.set(hash_key, data)
         return data
+
+    def _load_values(self, user_ids, props):
+        """
+        Load values of given properties for given users, set-based: \
+        one query per storage table and one for all big values, \
+        no matter how many properties or users are requested.
+        Slugs are resolved from given schema, missing values are empty strings.
+
+        @param user_ids: pks of identities
+        @type user_ids: list
+        @param props: site properties (schema) to load
+        @type props: list
+
+        @return: {slug: value} for each of user_ids
+        @rtype: dict
+        """
+        from entree.host.profiles.models import ProfileData, ProfileDataUnique, ProfileBigData
+
+        slugs = dict([(one.pk, one.slug) for one in props])
+        data = dict([(user_id, dict([(slug, "") for slug in slugs.values()])) for user_id in user_ids])
+        if not user_ids or not slugs:
+            return data
+
+        rows = list(ProfileData.objects.filter(site_property__in=slugs.keys(), user__in=user_ids).values(
+            'user_id', 'site_property_id', 'value_int', 'value_str', 'value_bool', 'value_big_id')) + \
+            list(ProfileDataUnique.objects.filter(site_property__in=slugs.keys(), user__in=user_ids).values(
+            'user_id', 'site_property_id', 'value_int', 'value_str'))
+
+        big_ids = [one['value_big_id'] for one in rows if one.get('value_big_id')]
+        big_values = ProfileBigData.objects.in_bulk(big_ids) if big_ids else {}
+
+        for one in rows:
+            if one.get('value_big_id'):
+                value = big_values[one['value_big_id']].value
+            else:
+                value = one['value_int'] or one.get('value_bool') or one['value_str']
+            data[one['user_id']][slugs[one['site_property_id']]] = value
+
+        return data
+
+
+class ProfileDataManager(models.Manager):
+
+    def search(self, site_property, value, site=None, after=None, limit=1000):
+        """
+        Find identities having given value of site property (ie. 'get users with newsletters').
+        Ids are ordered, next page starts after the last id of previous one (keyset \
+        pagination), so each page is one range scan of (site_property, value, user) index.
+        Long values kept in ProfileBigData are not searchable.
+
+        @param site_property: property to search by
+        @type site_property: SiteProperty
+        @param value: requested value, type should match property's value_type
+        @type value: mixed
+        @param site: limit result to identities w/ active profile for given site
+        @type site: EntreeSite
+        @param after: identity id the page starts after
+        @type after: int
+        @param limit: max number of ids returned
+        @type limit: int
+
+        @return: identity ids
+        @rtype: list
+        """
+        from entree.host.models import SiteProfile
+
+        columns = self.model.get_columns(value, site_property.value_type)
+        lookup = dict([(column, val) for column, val in columns.items() if val is not None])
+        if not lookup:
+            return []
+
+        qs = self.get_query_set().filter(site_property=site_property, **lookup)
+        if site is not None:
+            qs = qs.filter(user__in=SiteProfile.objects.filter(site=site, is_active=True).values('user'))
+        if after is not None:
+            qs = qs.filter(user__gt=after)
+
+        return list(qs.order_by('user').values_list('user_id', flat=True)[:limit])
@@ -1,12 +1,14 @@
 from cache_tools.fields import CachedForeignKey
 
-from django.db.models.signals import post_delete
+from django.db.models.signals import post_save, post_delete
 from django.db import models, IntegrityError
 from django.dispatch import receiver
 from django.utils.translation import ugettext_lazy as _
 from django.conf import settings
 
 from entree.host.managers import SitePropertyManager
+from entree.host.models import SiteProfile
+from entree.host.profiles.managers import ProfileDataManager
 
 
 ENTREE = settings.ENTREE
@@ -71,9 +73,34 @@ class ProfileDataBase(models.Model):
     value_int = models.IntegerField(_("Integer property value"), null=True)
     value_str = models.CharField(_("Short string property value"), max_length=20, null=True)
 
+    value_columns = ('value_int', 'value_str')
+
+    objects = ProfileDataManager()
+
     class Meta:
         abstract = True
 
+    @classmethod
+    def get_columns(cls, value, type_hint):
+        """
+        Columns representing given value, big values are not handled here
+
+        @param value: value to store
+        @type value: mixed
+        @param type_hint: value type of property (see PROPERTY_TYPE)
+        @type type_hint: str
+        @return: value for each of `value_columns`
+        @rtype: dict
+        """
+        columns = dict([(one, None) for one in cls.value_columns])
+        if type_hint == TYPE_INT:
+            columns['value_int'] = value
+        elif type_hint == TYPE_BOOL and 'value_bool' in columns:
+            columns['value_bool'] = value
+        else:
+            columns['value_str'] = value
+        return columns
+
     def __unicode__(self):
         return u"ProfileData %s" % self.site_property.name
 
@@ -127,6 +154,16 @@ class ProfileData(ProfileDataBase):
     value_big = CachedForeignKey("host.ProfileBigData", null=True)
     value_bool = models.NullBooleanField(_("Boolean property value"))
 
+    value_columns = ('value_int', 'value_str', 'value_bool')
+
+    class Meta:
+        #searching by value, unique table is covered by its unique_together
+        index_together = (
+            ('site_property', 'value_int', 'user'),
+            ('site_property', 'value_str', 'user'),
+            ('site_property', 'value_bool', 'user'),
+        )
+
     def set_value(self, value, type_hint=None):
         """
         set value by its length into:
@@ -178,3 +215,14 @@ def _signal_delete_profile_data(sender, **kwargs):
     prop = kwargs['instance']
     ProfileData.objects.filter(site_property=prop).delete()
     ProfileDataUnique.objects.filter(site_property=prop).delete()
+
+
+@receiver(post_save, sender=SiteProperty)
+@receiver(post_delete, sender=SiteProperty)
+def _signal_site_property_changed(sender, **kwargs):
+    prop = kwargs['instance']
+    SiteProperty.objects.invalidate()
+    SiteProfile.objects.invalidate_documents()
+
+    #schema version is part of document version, so profile rows are left intact
+    SiteProfile.objects.invalidate_site(prop.site_id or ENTREE['NOSITE_ID'])
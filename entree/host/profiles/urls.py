@@ -1,6 +1,7 @@
 from django.conf.urls import patterns, url
+from django.views.decorators.csrf import csrf_exempt
 
-from entree.host.profiles.views import ProfileEdit
+from entree.host.profiles.views import ProfileEdit, ProfileSearchView
 
 urlpatterns = patterns(
     'entree.host.views', # prefix
@@ -9,4 +10,6 @@ urlpatterns = patterns(
 
     #used only to generate appropriate link in class ShowApiView
     url(r'^edit/$', ProfileEdit.as_view(), name='profile_edit'),
+
+    url(r'^search/$', csrf_exempt(ProfileSearchView.as_view()), name='profile_search'),
 )
@@ -1,20 +1,45 @@
-from cache_tools.utils import get_cached_object
+import logging
+
+from django.conf import settings
 from django.contrib import messages
 from django.core.urlresolvers import reverse
-from django.http import HttpResponseRedirect, Http404
-from django.views.generic import FormView
+from django.http import HttpResponseRedirect, HttpResponseForbidden, Http404
+from django.views.generic import FormView, View
+from django.utils.translation import ugettext_lazy as _
+from entree.common.utils import calc_checksum
+from entree.common.views import JSONResponseMixin
 from entree.host.models import SiteProfile, EntreeSite
 from entree.host.profiles.forms import ProfileForm
+from entree.host.profiles.models import SiteProperty, ProfileData, ProfileDataUnique, TYPE_INT, TYPE_BOOL
 from entree.host.views import get_next_url, AuthRequiredMixin
 
 
+ENTREE = settings.ENTREE
+logger = logging.getLogger(__name__)
+
+
+def parse_search_value(site_property, value):
+    """
+    Convert value given in request into property's value type
+
+    @raise ValueError
+    """
+    if value is None:
+        raise ValueError("Missing value")
+    if site_property.value_type == TYPE_INT:
+        return int(value)
+    if site_property.value_type == TYPE_BOOL and not site_property.is_unique:
+        return value.lower() in ('1', 'true', 'on')
+    return value
+
+
 class ProfileEdit(AuthRequiredMixin, FormView):
     template_name = 'profile_edit.html'
     form_class = ProfileForm
 
     def dispatch(self, request, *args, **kwargs):
         try:
-            self.site = get_cached_object(EntreeSite, pk=kwargs['site_id'])
+            self.site = EntreeSite.objects.get_cached(pk=kwargs['site_id'])
         except (KeyError, EntreeSite.DoesNotExist):
             raise Http404(_("Requested site doesn't exist"))
 
@@ -29,12 +54,10 @@ class ProfileEdit(AuthRequiredMixin, FormView):
         return data
 
     def get_context_data(self, **kwargs):
-        profile, created = SiteProfile.objects.get_or_create(site=self.site, user=self.request.entree_user)
-
         data = super(ProfileEdit, self).get_context_data(**kwargs)
         data.update({
             'site': self.site,
-            'is_active': profile.is_active
+            'is_active': SiteProfile.objects.is_active(user=self.request.entree_user, site=self.site),
         })
         return data
 
@@ -47,3 +70,59 @@ class ProfileEdit(AuthRequiredMixin, FormView):
 
         return HttpResponseRedirect(get_next_url(self.kwargs['site_id'], next_url))
 
+
+class ProfileSearchView(JSONResponseMixin, View):
+
+    def get(self, request, *args, **kwargs):
+        request.POST = request.GET
+        return self.post(request, *args, **kwargs)
+
+    def post(self, request, *args, **kwargs):
+        """
+        request.POST contains following keys:
+        - site_id
+        - property (slug of site's or resident property)
+        - value
+        - checksum (of site_id, property and value)
+        - after (optional, `next` cursor from previous page)
+        - limit (optional)
+
+        @return: ids of identities w/ active profile for given site having given value \
+            and cursor of next page (null for the last one)
+        @rtype: json on success, HttpResponseForbidden on invalid input
+        """
+        data = request.POST
+        try:
+            site = EntreeSite.objects.get_cached(pk=data['site_id'])
+        except (EntreeSite.DoesNotExist, KeyError, ValueError):
+            logger.error("requested EntreeSite does not exist", extra={'site_id': data.get('site_id')})
+            return HttpResponseForbidden(_("Invalid site id"))
+
+        if not site.is_active:
+            return HttpResponseForbidden(_("Origin site is not active"))
+
+        expected_checksum = calc_checksum("%s:%s:%s" % (data['site_id'], data.get('property'), data.get('value')), salt=site.secret)
+        if expected_checksum != data.get('checksum'):
+            logger.error("Invalid search checksum")
+            return HttpResponseForbidden(_("Invalid checksum"))
+
+        props = dict([(one.slug, one) for one in SiteProperty.objects.get_site_props(site=site)])
+        site_property = props.get(data.get('property'))
+        if not site_property:
+            return HttpResponseForbidden(_("Unknown property"))
+
+        max_limit = ENTREE.get('SEARCH_LIMIT', 1000)
+        try:
+            value = parse_search_value(site_property, data.get('value'))
+            after = int(data['after']) if data.get('after') else None
+            limit = max(1, min(int(data.get('limit') or max_limit), max_limit))
+        except ValueError:
+            return HttpResponseForbidden(_("Invalid search parameters"))
+
+        DataClass = ProfileDataUnique if site_property.is_unique else ProfileData
+        ids = DataClass.objects.search(site_property, value, site=site, after=after, limit=limit)
+
+        return self.render_to_response({
+            'ids': ids,
+            'next': ids[-1] if ids and len(ids) == limit else None,
+        })
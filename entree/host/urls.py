@@ -1,10 +1,11 @@
 from django.conf.urls import patterns, url
 from django.views.decorators.csrf import csrf_exempt
 
-from entree.host.views import ProfileView, ProfileFetchView
+from entree.host.views import ProfileView, ProfileFetchView, ProfileFetchBatchView
 
 
 urlpatterns = patterns('entree.host.views',
     url(r'^fetch/$', csrf_exempt(ProfileFetchView.as_view()), name='profile_fetch'),
+    url(r'^fetch/batch/$', csrf_exempt(ProfileFetchBatchView.as_view()), name='profile_fetch_batch'),
     url(r'^$', ProfileView.as_view(), name='profile')
 )
@@ -6,29 +6,53 @@ from binascii import Error as DecodeError
 from django.conf import settings
 from django.contrib import messages
 from django.core.urlresolvers import reverse
-from django.http import HttpResponseForbidden, HttpResponseRedirect, Http404
+from django.http import HttpResponseForbidden, HttpResponseRedirect, HttpResponseNotModified, Http404
+from django.utils.http import parse_etags, quote_etag
 from django.views.generic.base import View, TemplateView
 from django.views.generic.edit import FormView
 from django.utils.translation import ugettext_lazy as _
 
+from entree.common.cache import LocalCache
 from entree.common.utils import calc_checksum, SHORT_CHECK
 from entree.common.views import JSONResponseMixin
 from entree.enauth.models import LoginToken
+from entree.enauth.tokens import resolve_identity, resolve_identities
+from entree.host.managers import SITE_NAMESPACE
 from entree.host.models import EntreeSite, SiteProfile
 
-from cache_tools.utils import get_cached_object
-
 
 ENTREE = settings.ENTREE
 logger = logging.getLogger(__name__)
 
+NEXT_URL_CACHE = LocalCache(SITE_NAMESPACE)
+
 
 def get_next_url(origin_site, next_url=None):
+    """
+    Validated url of origin site to redirect user to.
+    Results are memoized per site and flushed together w/ cached sites.
+
+    @param origin_site: pk of EntreeSite
+    @type origin_site: int
+    @param next_url: base64-encoded path w/ checksum made by site's secret
+    @type next_url: str
+    @rtype: str
+    """
     try:
-        site = EntreeSite.objects.get(pk=int(origin_site))
-    except (EntreeSite.DoesNotExist, TypeError):
+        site = EntreeSite.objects.get_cached(pk=origin_site)
+    except EntreeSite.DoesNotExist:
         return reverse('profile')
 
+    key = (site.pk, next_url)
+    url = NEXT_URL_CACHE.get(key)
+    if url is None:
+        version = NEXT_URL_CACHE.get_version()
+        url = _validate_next_url(site, next_url)
+        NEXT_URL_CACHE.set(key, url, version)
+    return url
+
+
+def _validate_next_url(site, next_url):
     try:
         url = b64decode(next_url)
         valid_url, checksum = url.split(':')
@@ -67,7 +91,7 @@ class ProfileFetchView(JSONResponseMixin, View):
         """
         data = request.POST
         try:
-            site = get_cached_object(EntreeSite, pk=data['site_id'])
+            site = EntreeSite.objects.get_cached(pk=data['site_id'])
         except (EntreeSite.DoesNotExist, KeyError):
             logger.error("requested EntreeSite does not exist", extra={'site_id': data.get('site_id')})
             return HttpResponseForbidden(_("Invalid site id"))
@@ -81,14 +105,63 @@ class ProfileFetchView(JSONResponseMixin, View):
             return HttpResponseForbidden(_("Invalid token checksum"))
 
         try:
-            login_token = get_cached_object(LoginToken, value=data['token'])
+            identity = resolve_identity(data.get('token'))
         except LoginToken.DoesNotExist:
-            logger.error("Requested token doesn't exist", extra={'token': data['token']})
+            logger.error("Requested token doesn't exist", extra={'token': data.get('token')})
             return HttpResponseForbidden(_("Invalid token"))
 
-        profile_data = SiteProfile.objects.get_data(user=login_token.user, site=site)
-        profile_data.update(login_token.user.basic_data)
-        return self.render_to_response(profile_data)
+        document = SiteProfile.objects.get_document(user=identity, site=site)
+
+        etag = "%s-%s-%s" % (identity.pk, site.pk, document['version'])
+        if etag in parse_etags(request.META.get('HTTP_IF_NONE_MATCH', '')):
+            return HttpResponseNotModified()
+
+        response = self.get_json_response(document['content'])
+        response['ETag'] = quote_etag(etag)
+        return response
+
+
+class ProfileFetchBatchView(JSONResponseMixin, View):
+
+    def post(self, request, *args, **kwargs):
+        """
+        request.POST contains following keys:
+        - token (repeated for each requested token)
+        - site_id
+        - checksum (of site_id and comma-separated tokens)
+
+        @return: identity data for each of given tokens, null for invalid tokens
+        @rtype: json on success, HttpResponseForbidden on invalid input
+        """
+        data = request.POST
+        try:
+            site = EntreeSite.objects.get_cached(pk=data['site_id'])
+        except (EntreeSite.DoesNotExist, KeyError):
+            logger.error("requested EntreeSite does not exist", extra={'site_id': data.get('site_id')})
+            return HttpResponseForbidden(_("Invalid site id"))
+
+        if not site.is_active:
+            return HttpResponseForbidden(_("Origin site is not active"))
+
+        tokens = data.getlist('token')
+        if len(tokens) > ENTREE.get('FETCH_BATCH_LIMIT', 500):
+            return HttpResponseForbidden(_("Too many tokens requested"))
+
+        expected_checksum = calc_checksum("%s:%s" % (data['site_id'], ','.join(tokens)), salt=site.secret)
+        if expected_checksum != data.get('checksum'):
+            logger.error("Invalid batch checksum")
+            return HttpResponseForbidden(_("Invalid token checksum"))
+
+        users = resolve_identities(tokens)
+
+        profiles = SiteProfile.objects.get_data_many(users=users.values(), site=site)
+
+        result = dict([(one, None) for one in tokens])
+        for value, user in users.items():
+            result[value] = profiles[user.pk]
+            result[value].update(user.basic_data)
+
+        return self.render_to_response(result)
 
 
 class ProfileView(AuthRequiredMixin, TemplateView):
@@ -70,6 +70,37 @@ class EntreeUserFetcherMixin(object):
             return EntreeUser.objects.create(key=token, data=json_data)
 
 
+    def _fetch_batch_params(self, tokens):
+        checksum = calc_checksum("%s:%s" % (ENTREE['SITE_ID'], ','.join(tokens)), salt=ENTREE['SECRET_KEY'])
+        return [('token', one) for one in tokens] + [
+            ('checksum', checksum),
+            ('site_id', ENTREE['SITE_ID']),
+        ]
+
+    def perform_fetch_batch(self, tokens):
+        """
+        Revalidate many tokens in one request
+
+        @param tokens: token values to revalidate
+        @type tokens: list
+        @return: remote profile data for each token, None for invalid tokens
+        @rtype: dict
+        """
+        route = ENTREE['ROUTE'].get('PROFILE_FETCH_BATCH', "%s/batch/" % ENTREE['ROUTE']['PROFILE_FETCH'].rstrip('/'))
+        url = "%s/%s" % (ENTREE['URL_SERVER'].rstrip('/'), route.lstrip('/'))
+        try:
+            fp = urlopen(url, data=urlencode(self._fetch_batch_params(tokens)), timeout=FETCH_TIMEOUT)
+        except URLError:
+            logger.error("Fetching remote profiles failed")
+            return {}
+
+        try:
+            return json.load(fp)
+        except json.JSONDecodeError:
+            logger.error("Deserialization of remote profiles failed")
+            return {}
+
+
 class EntreeUserDBManager(models.Manager, EntreeUserFetcherMixin):
 
     def create(self, key, **kwargs):
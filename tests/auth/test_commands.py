@@ -1,10 +1,16 @@
 import os
+import tempfile
 
+from StringIO import StringIO
+
+from datetime import datetime, timedelta
+
+from django.contrib.auth.hashers import make_password
 from django.core.cache import cache
 from django.core.management import call_command, CommandError
 from django.test.testcases import TestCase
 
-from entree.enauth.models import Identity
+from entree.enauth.models import Identity, LoginToken, AUTH_TOKEN, MAIL_TOKEN, TOKEN_TTL
 
 from mock import patch, Mock
 from nose.tools import assert_raises, assert_equals
@@ -90,3 +96,115 @@ class TestCommands(TestCase):
     def test_create_idenity_keybord_interrupt_works(self, mocked_input):
         mocked_input.side_effect = KeyboardInterrupt("STOP! Hammer time!")
         assert_raises(SystemExit, lambda: call_command('createidentity', stderr=DEVNULL))
+
+
+class TestPurgeTokens(TestCase):
+
+    def setUp(self):
+        super(TestPurgeTokens, self).setUp()
+        cache.clear()
+
+        self.user = Identity.objects.create(email=EMAIL)
+        self.old = datetime.now() - timedelta(seconds=TOKEN_TTL[AUTH_TOKEN] + 60)
+
+    def test_purge_deletes_only_expired(self):
+        fresh = self.user.create_token()
+        for i in range(3):
+            LoginToken.objects.create(user=self.user, value='OLD%s' % i, touched=self.old)
+
+        call_command('purgetokens', stdout=DEVNULL)
+
+        assert_equals([fresh], list(LoginToken.objects.all()))
+
+    def test_purge_in_batches(self):
+        for i in range(5):
+            LoginToken.objects.create(user=self.user, value='OLD%s' % i, touched=self.old)
+
+        call_command('purgetokens', batch_size=2, stdout=DEVNULL)
+
+        assert_equals(0, LoginToken.objects.count())
+
+    def test_purge_only_requested_type(self):
+        LoginToken.objects.create(user=self.user, value='OLDAUTH', touched=self.old)
+        LoginToken.objects.create(user=self.user, value='OLDMAIL', token_type=MAIL_TOKEN,
+                                  touched=datetime.now() - timedelta(seconds=TOKEN_TTL[MAIL_TOKEN] + 60))
+
+        call_command('purgetokens', token_types=[MAIL_TOKEN], stdout=DEVNULL)
+
+        assert_equals(['OLDAUTH'], list(LoginToken.objects.values_list('value', flat=True)))
+
+    def test_purge_flushes_token_cache(self):
+        LoginToken.objects.create(user=self.user, value='OLDCACHED', touched=self.old)
+        LoginToken.objects.get_cached('OLDCACHED')
+
+        call_command('purgetokens', stdout=DEVNULL)
+
+        assert_raises(LoginToken.DoesNotExist, lambda: LoginToken.objects.get_cached('OLDCACHED'))
+
+    def test_purge_unknown_type_raises(self):
+        assert_raises(CommandError, lambda: call_command('purgetokens', token_types=['!FOO!'], stdout=DEVNULL))
+
+
+class TestImportIdentities(TestCase):
+
+    def setUp(self):
+        super(TestImportIdentities, self).setUp()
+        fd, self.path = tempfile.mkstemp(suffix='.csv')
+        os.close(fd)
+
+    def tearDown(self):
+        os.remove(self.path)
+        super(TestImportIdentities, self).tearDown()
+
+    def _write(self, content):
+        with open(self.path, 'w') as fp:
+            fp.write(content)
+
+    def test_import_csv_hashes_passwords(self):
+        self._write("email,password,is_active\nFoo@bar.cz,foo,1\nbar@bar.cz,bar,0\n")
+
+        call_command('importidentities', self.path, processes=1, stdout=DEVNULL)
+
+        identity = Identity.objects.get(email='foo@bar.cz')
+        assert_equals(True, identity.is_active)
+        assert_equals(True, identity.check_password('foo'))
+        assert_equals(False, Identity.objects.get(email='bar@bar.cz').is_active)
+
+    def test_import_skips_registered_and_duplicate_emails(self):
+        Identity.objects.create(email=EMAIL)
+        self._write("email,password\n%s,foo\nnew@bar.cz,foo\nNEW@bar.cz,foo\ninvalid,foo\n" % EMAIL)
+
+        call_command('importidentities', self.path, processes=1, batch_size=2, stdout=DEVNULL)
+
+        assert_equals(2, Identity.objects.count())
+        assert_equals(1, Identity.objects.filter(email='new@bar.cz').count())
+
+    @patch('entree.enauth.management.commands.importidentities.Command.get_registered', Mock(return_value=[]))
+    def test_import_skips_emails_registered_meanwhile(self):
+        Identity.objects.create(email=EMAIL)
+        self._write("email,password\nnew@bar.cz,foo\n%s,foo\nnext@bar.cz,foo\n" % EMAIL)
+
+        call_command('importidentities', self.path, processes=1, stdout=DEVNULL)
+
+        assert_equals(3, Identity.objects.count())
+        assert_equals(1, Identity.objects.filter(email=EMAIL).count())
+
+    def test_import_reports_incomplete_rows(self):
+        stderr = StringIO()
+        self._write("email,password,is_active\nfoo@bar.cz,foo,1\nbar@bar.cz\n")
+
+        call_command('importidentities', self.path, processes=1, stdout=DEVNULL, stderr=stderr)
+
+        assert_equals(['foo@bar.cz'], list(Identity.objects.values_list('email', flat=True)))
+        assert_equals(True, 'line 3' in stderr.getvalue())
+
+    def test_import_jsonl_hashed_passwords(self):
+        hashed = make_password('foo')
+        self._write('{"email": "foo@bar.cz", "password": "%s"}\n' % hashed)
+
+        call_command('importidentities', self.path, format='jsonl', hashed=True, stdout=DEVNULL)
+
+        assert_equals(hashed, Identity.objects.get(email='foo@bar.cz').password)
+
+    def test_import_unknown_format_raises(self):
+        assert_raises(CommandError, lambda: call_command('importidentities', self.path, format='xml', stdout=DEVNULL))
@@ -3,6 +3,7 @@ from django.http import HttpRequest
 from django.test import TestCase
 
 from entree.enauth.forms import EntreeAuthForm, CreateIdentityForm, RecoveryForm, BasicPasswordForm, ChangePasswordForm
+from entree.enauth.hashers import HashingBusy
 from entree.enauth.models import Identity
 from entree.host.models import EntreeSite
 
@@ -177,3 +178,11 @@ class TestPasswordForms(TestCase):
         form = ChangePasswordForm(data=data, entree_user=self.user)
         assert_equals(False, form.is_valid())
         assert_equals(['old_password'], form.errors.keys())
+
+    @patch('entree.enauth.hashers.hashers.make_password')
+    def test_busy_hashing_is_form_error(self, mocked_make):
+        mocked_make.side_effect = HashingBusy()
+        form = BasicPasswordForm(data=dict(password='foo', password2='foo'))
+
+        assert_equals(False, form.is_valid())
+        assert_equals(['__all__'], form.errors.keys())
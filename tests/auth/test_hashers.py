@@ -0,0 +1,71 @@
+import time
+
+from django.contrib.auth.hashers import check_password as django_check_password
+from django.test import TestCase
+
+from entree.enauth import hashers
+from entree.enauth.hashers import HashingExecutor, HashingBusy
+
+from mock import patch
+from nose.tools import assert_raises, assert_equals
+
+
+class TestHashingExecutor(TestCase):
+
+    def test_full_queue_rejected_fast(self):
+        executor = HashingExecutor(processes=1, queue_limit=2)
+        executor.pending = 2
+
+        assert_raises(HashingBusy, lambda: executor.run(hashers.hashers.make_password, 'foo'))
+        assert_equals(1, executor.get_stats()['rejected'])
+
+    def test_timed_out_job_keeps_its_slot(self):
+        executor = HashingExecutor(processes=1, queue_limit=1, timeout=0.05)
+
+        assert_raises(HashingBusy, lambda: executor.run(time.sleep, 0.5))
+        assert_equals(1, executor.get_stats()['pending'])
+        assert_raises(HashingBusy, lambda: executor.run(time.sleep, 0))
+        assert_equals(1, executor.get_stats()['rejected'])
+
+        pool = executor.get_pool()
+        pool.close()
+        pool.join()
+        assert_equals(0, executor.get_stats()['pending'])
+
+    def test_failed_job_releases_slot(self):
+        executor = HashingExecutor(processes=1)
+
+        assert_raises(ValueError, lambda: executor.run(int, 'foo'))
+        assert_equals(0, executor.get_stats()['pending'])
+
+    def test_hash_in_worker_process(self):
+        executor = HashingExecutor(processes=1)
+        with patch('entree.enauth.hashers.get_executor', lambda: executor):
+            encoded = hashers.make_password('foo')
+            assert_equals(True, hashers.check_password('foo', encoded))
+            assert_equals(False, hashers.check_password('bar', encoded))
+
+        assert_equals(True, django_check_password('foo', encoded))
+        assert_equals(0, executor.get_stats()['pending'])
+        assert_equals(3, executor.get_stats()['done'])
+
+    @patch('entree.enauth.hashers.logger')
+    def test_stats_logged_periodically(self, mocked_logger):
+        executor = HashingExecutor(processes=1, stats_interval=0)
+        executor.run(hashers.hashers.make_password, 'foo')
+
+        message, stats = mocked_logger.info.call_args[0]
+        assert_equals(1, stats['done'])
+        assert_equals(0, stats['pending'])
+        assert_equals(True, '1 done' in message % stats)
+
+    @patch('entree.enauth.hashers.logger')
+    def test_stats_not_logged_within_interval(self, mocked_logger):
+        executor = HashingExecutor(processes=1, stats_interval=60)
+        executor.run(hashers.hashers.make_password, 'foo')
+
+        assert_equals(False, mocked_logger.info.called)
+
+    def test_inline_hashing_by_default(self):
+        assert_equals(None, hashers.get_executor())
+        assert_equals(True, hashers.check_password('foo', hashers.make_password('foo')))
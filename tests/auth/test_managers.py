@@ -47,3 +47,43 @@ class TestAuthManagers(TestCase):
         LoginToken.objects.create(value='COLLIDE_ME', user=token_user)
 
         assert_raises(IntegrityError, lambda: LoginToken.objects.create(value='COLLIDE_ME', user=token_user))
+
+
+class TestTokenCache(TestCase):
+
+    def setUp(self):
+        super(TestTokenCache, self).setUp()
+        cache.clear()
+
+        self.user = Identity.objects.create(email='foo@bar.cz')
+
+    def test_get_cached_token_hits_db_once(self):
+        token = LoginToken.objects.create(value='CACHED', user=self.user)
+
+        assert_equals(token, LoginToken.objects.get_cached('CACHED'))
+        with self.assertNumQueries(0):
+            assert_equals(token, LoginToken.objects.get_cached('CACHED'))
+
+    def test_missing_token_is_cached(self):
+        assert_raises(LoginToken.DoesNotExist, lambda: LoginToken.objects.get_cached('MISSING1'))
+
+        with self.assertNumQueries(0):
+            assert_raises(LoginToken.DoesNotExist, lambda: LoginToken.objects.get_cached('MISSING1'))
+
+    def test_malformed_token_skips_db(self):
+        with self.assertNumQueries(0):
+            assert_raises(LoginToken.DoesNotExist, lambda: LoginToken.objects.get_cached('bad token!'))
+            assert_raises(LoginToken.DoesNotExist, lambda: LoginToken.objects.get_cached(None))
+
+    def test_create_token_flushes_missing_mark(self):
+        assert_raises(LoginToken.DoesNotExist, lambda: LoginToken.objects.get_cached('LATE'))
+
+        token = LoginToken.objects.create(value='LATE', user=self.user)
+        assert_equals(token, LoginToken.objects.get_cached('LATE'))
+
+    def test_delete_token_flushes_cache(self):
+        token = LoginToken.objects.create(value='GONE', user=self.user)
+        LoginToken.objects.get_cached('GONE')
+
+        token.delete()
+        assert_raises(LoginToken.DoesNotExist, lambda: LoginToken.objects.get_cached('GONE'))
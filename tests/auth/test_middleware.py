@@ -62,3 +62,43 @@ class TestAuthMiddleware(TestCase):
 
         res = AuthMiddleware().process_request(self.request)
         assert_equals(None, res)
+
+    def test_get_user_cached(self):
+        get_user(self.request)
+
+        request = HttpRequest()
+        request.session = self.request.session
+        with self.assertNumQueries(0):
+            assert_equals(self.user, get_user(request))
+
+    def test_cached_user_flushed_on_save(self):
+        get_user(self.request)
+
+        self.user.mail_verified = True
+        self.user.save()
+
+        request = HttpRequest()
+        request.session = self.request.session
+        assert_equals(True, get_user(request).mail_verified)
+
+    def test_cached_user_flushed_on_delete(self):
+        get_user(self.request)
+        self.user.delete()
+
+        request = HttpRequest()
+        request.session = self.request.session
+        assert_equals(AnonymousUser, get_user(request).__class__)
+
+    def test_user_set_per_request(self):
+        AuthMiddleware().process_request(self.request)
+
+        assert_equals(False, hasattr(HttpRequest, 'entree_user'))
+
+    def test_anonymous_request_does_not_load_user(self):
+        request = HttpRequest()
+        request.session = SessionStore()
+
+        with self.assertNumQueries(0):
+            assert_equals(None, AuthMiddleware().process_request(request))
+
+        assert_equals(False, request.entree_user.is_authenticated())
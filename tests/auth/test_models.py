@@ -1,11 +1,11 @@
-from cache_tools.utils import get_cached_object
 from django.contrib.auth.hashers import UNUSABLE_PASSWORD
 from django.core.cache import cache
-from django.core.exceptions import ObjectDoesNotExist
 from django.db.utils import IntegrityError
 from django.test import TestCase
 
-from entree.enauth.models import Identity, MAIL_TOKEN, LoginToken
+from datetime import datetime, timedelta
+
+from entree.enauth.models import Identity, MAIL_TOKEN, AUTH_TOKEN, LoginToken, TOKEN_TTL
 from nose.tools import assert_raises, assert_equals, assert_not_equals, assert_almost_equals
 from mock import patch, Mock, call
 
@@ -58,6 +58,46 @@ class TestIdentity(TestCase):
         assert_equals(True, password_checked)
         assert_equals(1, ident.set_password.call_count)
 
+    def test_dirty_fields_tracked(self):
+        identity = Identity.objects.get(pk=self.user.pk)
+        assert_equals([], identity.get_dirty_fields())
+
+        identity.mail_verified = True
+        assert_equals(['mail_verified'], identity.get_dirty_fields())
+
+        identity.save()
+        assert_equals([], identity.get_dirty_fields())
+
+    def test_save_unchanged_identity_does_nothing(self):
+        identity = Identity.objects.get(pk=self.user.pk)
+        with self.assertNumQueries(0):
+            identity.save()
+
+    def test_save_writes_changed_columns_only(self):
+        identity = Identity.objects.get(pk=self.user.pk)
+        Identity.objects.filter(pk=self.user.pk).update(mail_verified=True)
+
+        identity.set_password('foo')
+        identity.save()
+
+        identity = Identity.objects.get(pk=self.user.pk)
+        assert_equals(True, identity.mail_verified)
+        assert_equals(True, identity.check_password('foo'))
+
+    def test_tokens_purged_only_on_deactivation(self):
+        self.user.is_active = True
+        self.user.save()
+        self.user.create_token()
+
+        self.user.is_active = False
+        self.user.save()
+        assert_equals(0, LoginToken.objects.filter(user=self.user).count())
+
+        #already inactive identity doesn't delete anything
+        with self.assertNumQueries(1):
+            self.user.mail_verified = True
+            self.user.save()
+
     def test_user_has_unusable_password(self):
         assert_equals(self.user.password, UNUSABLE_PASSWORD)
         self.user.set_password("")
@@ -66,9 +106,9 @@ class TestIdentity(TestCase):
     def test_delete_token_flush_cache(self):
         token_key = 'TOKEN_KEY'
         token = LoginToken.objects.create(user=self.user, value=token_key)
-        get_cached_object(LoginToken, value=token_key)
+        LoginToken.objects.get_cached(token_key)
         token.delete()
-        assert_raises(ObjectDoesNotExist, lambda: get_cached_object(LoginToken, value=token_key))
+        assert_raises(LoginToken.DoesNotExist, lambda: LoginToken.objects.get_cached(token_key))
 
     def test_create_invalid_token_type(self):
         assert_raises(ValueError, lambda: self.user.create_token(token_type='!FOO!'))
@@ -78,3 +118,18 @@ class TestIdentity(TestCase):
 
     def test_get_identity_basic_data(self):
         assert_equals(dict(email=self.user.email), self.user.basic_data)
+
+    def test_token_expiry(self):
+        token = self.user.create_token()
+        assert_equals(False, token.is_expired())
+
+        token.touched = datetime.now() - timedelta(seconds=TOKEN_TTL[AUTH_TOKEN] + 1)
+        assert_equals(True, token.is_expired())
+
+    def test_valid_tokens_exclude_expired(self):
+        token = self.user.create_token(token_type=MAIL_TOKEN)
+        assert_equals([token], list(LoginToken.objects.valid(MAIL_TOKEN)))
+
+        LoginToken.objects.filter(pk=token.pk).update(touched=datetime.now() - timedelta(seconds=TOKEN_TTL[MAIL_TOKEN] + 1))
+        assert_equals([], list(LoginToken.objects.valid(MAIL_TOKEN)))
+        assert_equals([token], list(LoginToken.objects.expired(MAIL_TOKEN)))
@@ -0,0 +1,117 @@
+import time
+
+from datetime import datetime, timedelta
+
+from django.core.cache import cache
+from django.test import TestCase
+
+from entree.enauth.models import Identity, LoginToken, AUTH_TOKEN, MAIL_TOKEN, TOKEN_TTL
+from entree.enauth.tokens import (make_signed_token, parse_signed_token, resolve_identity, resolve_identities,
+    get_generation, SIGNED_LENGTH)
+
+from mock import patch
+from nose.tools import assert_raises, assert_equals, assert_not_equals
+
+
+class TestSignedTokens(TestCase):
+
+    def setUp(self):
+        super(TestSignedTokens, self).setUp()
+        cache.clear()
+
+        self.user = Identity.objects.create(email='foo@bar.cz', is_active=True)
+
+    def test_signed_token_roundtrip(self):
+        value = make_signed_token(self.user.pk)
+
+        assert_equals(SIGNED_LENGTH, len(value))
+        identity_id, issued, generation = parse_signed_token(value)
+        assert_equals(self.user.pk, identity_id)
+        assert_equals(get_generation(self.user.pk), generation)
+
+    def test_tokens_issued_in_same_second_differ(self):
+        assert_not_equals(make_signed_token(self.user.pk), make_signed_token(self.user.pk))
+
+    def test_tampered_token_not_parsed(self):
+        value = make_signed_token(self.user.pk)
+        forged = value[:1] + make_signed_token(self.user.pk + 1)[1:7] + value[7:]
+
+        assert_equals(None, parse_signed_token(forged))
+
+    def test_random_token_not_parsed(self):
+        assert_equals(None, parse_signed_token(self.user.create_token().value))
+
+    @patch.dict('entree.enauth.tokens.ENTREE', {'SIGNED_TOKENS': True})
+    def test_create_signed_auth_token(self):
+        token = self.user.create_token()
+        assert_not_equals(None, parse_signed_token(token.value))
+
+        mail_token = self.user.create_token(token_type=MAIL_TOKEN)
+        assert_equals(None, parse_signed_token(mail_token.value))
+
+    @patch.dict('entree.enauth.tokens.ENTREE', {'SIGNED_TOKENS': True})
+    def test_resolve_signed_token_without_token_lookup(self):
+        token = self.user.create_token()
+        assert_equals(self.user, resolve_identity(token.value))
+
+        with self.assertNumQueries(0):
+            assert_equals(self.user, resolve_identity(token.value))
+
+    @patch.dict('entree.enauth.tokens.ENTREE', {'SIGNED_TOKENS': True})
+    def test_signed_token_resolves_saved_identity(self):
+        token = self.user.create_token()
+        resolve_identity(token.value)
+
+        self.user.email = 'changed@bar.cz'
+        self.user.save()
+        assert_equals('changed@bar.cz', resolve_identity(token.value).email)
+
+    @patch.dict('entree.enauth.tokens.ENTREE', {'SIGNED_TOKENS': True})
+    def test_deleted_signed_token_revoked(self):
+        token = self.user.create_token()
+        resolve_identity(token.value)
+
+        token.delete()
+        assert_raises(LoginToken.DoesNotExist, lambda: resolve_identity(token.value))
+
+    @patch.dict('entree.enauth.tokens.ENTREE', {'SIGNED_TOKENS': True})
+    def test_other_tokens_survive_revocation(self):
+        token = self.user.create_token()
+        other = self.user.create_token()
+
+        token.delete()
+        assert_equals(self.user, resolve_identity(other.value))
+
+    @patch.dict('entree.enauth.tokens.ENTREE', {'SIGNED_TOKENS': True})
+    def test_signed_token_falls_back_to_db_without_generation(self):
+        token = self.user.create_token()
+        cache.clear()
+
+        assert_equals(self.user, resolve_identity(token.value))
+
+    def test_inactive_owner_refused(self):
+        token = self.user.create_token()
+        Identity.objects.filter(pk=self.user.pk).update(is_active=False)
+        cache.clear()
+
+        assert_raises(LoginToken.DoesNotExist, lambda: resolve_identity(token.value))
+        assert_equals({}, resolve_identities([token.value]))
+
+    @patch.dict('entree.enauth.tokens.ENTREE', {'SIGNED_TOKENS': True})
+    def test_resolve_identities_signed_and_random(self):
+        signed = self.user.create_token()
+        with patch.dict('entree.enauth.tokens.ENTREE', {'SIGNED_TOKENS': False}):
+            random = self.user.create_token()
+
+        assert_equals({signed.value: self.user, random.value: self.user},
+            resolve_identities([signed.value, random.value, 'UNKNOWN']))
+
+    @patch('entree.enauth.tokens.time.time')
+    def test_expired_signed_token_refused(self, mocked_time):
+        past = datetime.now() - timedelta(seconds=TOKEN_TTL[AUTH_TOKEN] + 60)
+        mocked_time.return_value = time.mktime(past.timetuple())
+        value = make_signed_token(self.user.pk)
+        LoginToken.objects.create(user=self.user, value=value, touched=past)
+
+        mocked_time.return_value = time.mktime(datetime.now().timetuple())
+        assert_raises(LoginToken.DoesNotExist, lambda: resolve_identity(value))
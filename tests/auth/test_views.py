@@ -22,9 +22,10 @@ from entree.enauth.models import Identity, LoginToken, AUTH_TOKEN, MAIL_TOKEN, R
 from entree.enauth.views import (EntreeAuthMixin, LoginView, LogoutView,
     LoginHashView, CreateIdentityView, IdentityVerifyView, IdentityVerifyResend,
     RecoveryLoginView, PasswordRecoveryRequestView, PasswordResetView, PasswordChangeView,
-    ShowApiView)
+    ShowApiView, ShowApiJsonView, LOGIN_HASH_ETAGS)
 from entree.common.utils import ENTREE_SAFE, calc_checksum, SHORT_CHECK
 from entree.host.models import EntreeSite, SiteProfile
+from entree.host.views import get_next_url
 
 
 ENTREE = settings.ENTREE
@@ -154,6 +155,36 @@ class TestAuthMixin(TestCase):
         token = LoginToken.objects.get(token_type=AUTH_TOKEN, user=self.user)
         assert_equals(context['user_token'], token.value)
 
+    @patch('entree.enauth.views.render_to_response')
+    def test_login_stores_token_by_single_insert(self, patched_render):
+        with self.assertNumQueries(1):
+            self.mixin.entree_login(self.user)
+
+        token = LoginToken.objects.get(value=self.request.session[ENTREE['STORAGE_TOKEN_KEY']])
+        assert_equals(self.request.session.session_key, token.app_data['session'])
+
+    @patch('entree.enauth.views.render_to_response')
+    def test_login_to_site_query_budget(self, patched_render):
+        site = EntreeSite.objects.create(pk=ENTREE['SITE_ID'])
+        SiteProfile.objects.create(user=self.user, site=site, is_active=True)
+        self.mixin.entree_login(self.user, site_id=site.pk)
+
+        #site and profile activity are cached, only the new token is stored
+        with self.assertNumQueries(1):
+            self.mixin.entree_login(self.user, site_id=site.pk)
+
+    @patch('entree.enauth.views.render_to_response')
+    def test_login_notices_activated_profile(self, patched_render):
+        site = EntreeSite.objects.create(pk=ENTREE['SITE_ID'])
+        self.mixin.entree_login(self.user, site_id=site.pk)
+
+        SiteProfile.objects.create(user=self.user, site=site, is_active=True)
+        self.mixin.entree_login(self.user, site_id=site.pk)
+
+        args, kwargs = patched_render.call_args
+        template, context = args
+        assert_equals(get_next_url(site.pk), context['next_url'])
+
 
 
 
@@ -259,6 +290,43 @@ class TestLoginLogoutViews(TestCase):
         view.render_to_response = mocked_render
         view.get(self.request)
 
+    def test_view_loginhash_not_modified(self):
+        response = LoginHashView.as_view()(self.request)
+        assert_equals(200, response.status_code)
+
+        request = init_request()
+        request.META['HTTP_IF_NONE_MATCH'] = response['ETag']
+        with self.assertNumQueries(0):
+            response = LoginHashView.as_view()(request)
+        assert_equals(304, response.status_code)
+
+    def test_view_loginhash_whitelist_follows_sites(self):
+        etag = LoginHashView.as_view()(self.request)['ETag']
+        EntreeSite.objects.create(title='new', is_active=True, secret='neco', url="http://new.example.com")
+
+        assert_equals(True, 'new.example.com' in EntreeSite.objects.get_whitelist()['domains'])
+
+        request = init_request()
+        request.META['HTTP_IF_NONE_MATCH'] = etag
+        assert_equals(200, LoginHashView.as_view()(request).status_code)
+
+    def test_view_loginhash_etag_follows_content(self):
+        LOGIN_HASH_ETAGS.clear()
+        etag = LoginHashView.as_view()(self.request)['ETag']
+
+        #same whitelist and version, different page (new template or settings after deploy)
+        LOGIN_HASH_ETAGS.clear()
+        request = init_request()
+        request.META['HTTP_IF_NONE_MATCH'] = etag
+        try:
+            with patch('entree.enauth.views.render_to_string', Mock(return_value=u'changed')):
+                response = LoginHashView.as_view()(request)
+        finally:
+            LOGIN_HASH_ETAGS.clear()
+
+        assert_equals(200, response.status_code)
+        assert_equals(False, etag == response['ETag'])
+
 
 class TestPasswordViews(TestCase):
 
@@ -589,3 +657,42 @@ class TestApiView(TestCase):
         ViewClass = ShowApiView.as_view()
         res = ViewClass(self.request, site_id=site.pk)
         assert_equals(type(res), TemplateResponse)
+
+    def test_unknown_site_not_found(self):
+        ViewClass = ShowApiView.as_view()
+        assert_raises(Http404, lambda: ViewClass(self.request, site_id='999'))
+
+    def test_json_config(self):
+        site = EntreeSite.objects.create(pk=ENTREE['SITE_ID'], url='http://example.com/')
+
+        res = ShowApiJsonView.as_view()(self.request, site_id=str(site.pk))
+        config = json.loads(res.content)
+
+        assert_equals(200, res.status_code)
+        assert_equals(site.pk, config['SITE_ID'])
+        assert_equals('example.com', config['COOKIE']['DOMAIN'])
+        assert_equals('REPLACE_ME', config['SECRET_KEY'])
+        assert_equals(reverse('profile_fetch'), config['ROUTE']['PROFILE_FETCH'])
+
+    def test_json_config_not_modified(self):
+        site = EntreeSite.objects.create(pk=ENTREE['SITE_ID'], url='http://example.com/')
+        ViewClass = ShowApiJsonView.as_view()
+        etag = ViewClass(self.request, site_id=str(site.pk))['ETag']
+
+        self.request.META['HTTP_IF_NONE_MATCH'] = etag
+        with self.assertNumQueries(0):
+            res = ViewClass(self.request, site_id=str(site.pk))
+        assert_equals(304, res.status_code)
+
+    def test_json_config_changes_with_site(self):
+        site = EntreeSite.objects.create(pk=ENTREE['SITE_ID'], url='http://example.com/')
+        ViewClass = ShowApiJsonView.as_view()
+        etag = ViewClass(self.request, site_id=str(site.pk))['ETag']
+
+        site.url = 'http://other.example.com/'
+        site.save()
+
+        self.request.META['HTTP_IF_NONE_MATCH'] = etag
+        res = ViewClass(self.request, site_id=str(site.pk))
+        assert_equals(200, res.status_code)
+        assert_equals('other.example.com', json.loads(res.content)['COOKIE']['DOMAIN'])
@@ -0,0 +1,63 @@
+#!/usr/bin/env python
+
+"""
+Microbenchmark of enauth AuthMiddleware, not collected by nose.
+
+    python tests/bench_middleware.py [iterations]
+
+Shows time per request for anonymous, static and authenticated requests \
+(identity already cached, as it is for all requests but the first one).
+"""
+
+import os
+import sys
+import timeit
+
+from os.path import abspath, dirname
+
+sys.path.insert(0, dirname(dirname(abspath(__file__))))
+os.environ['DJANGO_SETTINGS_MODULE'] = 'tests.settings'
+
+
+def run(iterations):
+    from django.conf import settings
+    from django.core.management import call_command
+    from django.contrib.sessions.backends.cache import SessionStore
+    from django.http import HttpRequest
+
+    from entree.enauth.middleware import AuthMiddleware
+    from entree.enauth.models import Identity
+
+    call_command('syncdb', interactive=False, verbosity=0)
+    identity, created = Identity.objects.get_or_create(email='bench@example.com',
+        defaults={'is_active': True, 'mail_verified': True})
+
+    middleware = AuthMiddleware()
+
+    def make_request(path, authenticated=False):
+        request = HttpRequest()
+        request.path = path
+        request.session = SessionStore()
+        if authenticated:
+            request.session[settings.ENTREE['SESSION_KEY']] = identity.pk
+        return request
+
+    cases = (
+        ('anonymous', lambda: make_request('/profile/')),
+        ('static', lambda: make_request(settings.STATIC_URL + 'js/entree.js', authenticated=True)),
+        ('authenticated', lambda: make_request('/profile/', authenticated=True)),
+    )
+
+    #warm up caches (identity, url resolver)
+    for name, factory in cases:
+        middleware.process_request(factory())
+
+    for name, factory in cases:
+        requests = [factory() for i in range(iterations)]
+        it = iter(requests)
+        total = timeit.timeit(lambda: middleware.process_request(next(it)), number=iterations)
+        sys.stdout.write("%-15s %8.2f us/request\n" % (name, total / iterations * 1e6))
+
+
+if __name__ == '__main__':
+    run(int(sys.argv[1]) if len(sys.argv) > 1 else 10000)
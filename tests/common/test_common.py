@@ -3,9 +3,11 @@ from django.http import HttpRequest
 import simplejson as json
 from hashlib import sha1
 
+from django.core.cache import cache
 from django.test.testcases import TestCase
 from django.conf import settings
 
+from entree.common.cache import CacheStats, LocalCache, get_namespace_version, bump_namespace_version
 from entree.common.utils import calc_checksum
 from entree.common.views import JSONResponseMixin
 from entree.common.context_processors import common as common_cp
@@ -41,3 +43,66 @@ class TestCommonStuff(TestCase):
         request = HttpRequest()
         request.entree_user = AnonymousUser()
         assert_equals(dict, type(common_cp(request)))
+
+
+class TestCacheTools(TestCase):
+
+    def setUp(self):
+        super(TestCacheTools, self).setUp()
+        cache.clear()
+
+    def test_namespace_version_stable(self):
+        assert_equals(get_namespace_version('foo'), get_namespace_version('foo'))
+
+    def test_namespace_version_bump(self):
+        version = get_namespace_version('foo')
+        bump_namespace_version('foo')
+        assert_equals(version + 1, get_namespace_version('foo'))
+
+    def test_stats_summed_in_shared_cache(self):
+        stats = CacheStats('test', flush_every=3)
+        stats.hit()
+        stats.hit()
+        stats.miss()
+
+        other = CacheStats('test', flush_every=10)
+        assert_equals(dict(hit=2, miss=1), other.get_counts())
+
+    def test_stats_reset(self):
+        stats = CacheStats('test')
+        stats.hit()
+        stats.reset()
+        assert_equals(dict(hit=0, miss=0), stats.get_counts())
+
+    def test_local_cache_lru_eviction(self):
+        local = LocalCache('test', max_size=2, check_interval=60)
+        local.set('a', 1)
+        local.set('b', 2)
+        local.get('a')
+        local.set('c', 3)
+
+        assert_equals(1, local.get('a'))
+        assert_equals(None, local.get('b'))
+        assert_equals(3, local.get('c'))
+
+    def test_local_cache_dropped_on_namespace_change(self):
+        local = LocalCache('test', check_interval=0)
+        local.set('a', 1)
+
+        bump_namespace_version('test')
+        assert_equals(None, local.get('a'))
+
+    def test_local_cache_checks_namespace_once_in_interval(self):
+        local = LocalCache('test', check_interval=60)
+        local.set('a', 1)
+
+        bump_namespace_version('test')
+        assert_equals(1, local.get('a'))
+
+    def test_local_cache_ignores_stale_version(self):
+        local = LocalCache('test', check_interval=0)
+        version = local.get_version()
+
+        local.invalidate()
+        local.set('a', 1, version)
+        assert_equals(None, local.get('a'))
@@ -63,6 +63,7 @@ ENTREE = {
     'SESSION_KEY': 'entree_session',
     'STORAGE_TOKEN_KEY': 'entree_token', #localstorage's key which contains token (SERVER)
     'DEFAULT_SITE': 2,
+    'LOCAL_CACHE_CHECK': 0, #tests flush shared cache, process-local one has to notice it
 }
 
 CACHES = {
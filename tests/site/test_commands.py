@@ -0,0 +1,68 @@
+import csv
+import os
+import tempfile
+
+from StringIO import StringIO
+
+import simplejson as json
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.management import call_command, CommandError
+from django.test.testcases import TestCase
+
+from entree.enauth.models import Identity
+from entree.host.models import EntreeSite, SiteProfile
+from entree.host.profiles.models import SiteProperty, ProfileData
+
+from nose.tools import assert_raises, assert_equals
+
+
+ENTREE = settings.ENTREE
+
+
+class TestExportProfiles(TestCase):
+
+    def setUp(self):
+        super(TestExportProfiles, self).setUp()
+        cache.clear()
+
+        self.nosite = EntreeSite.objects.create(id=ENTREE['NOSITE_ID'])
+        self.site = EntreeSite.objects.create(title='foo', url='http://foo.cz')
+        self.prop = SiteProperty.objects.create(slug='nick', site=self.site)
+
+        self.users = [Identity.objects.create(email='foo%s@bar.cz' % i) for i in range(5)]
+        for i, one in enumerate(self.users):
+            SiteProfile.objects.create(user=one, site=self.site, is_active=i != 2)
+            ProfileData(user=one, site_property=self.prop).set_value('nick%s' % i)
+
+        fd, self.output = tempfile.mkstemp()
+        os.close(fd)
+
+    def tearDown(self):
+        os.remove(self.output)
+        super(TestExportProfiles, self).tearDown()
+
+    def test_export_jsonl_in_chunks(self):
+        call_command('exportprofiles', site_id=self.site.pk, format='jsonl', chunk_size=2, output=self.output, verbosity=0)
+
+        rows = [json.loads(one) for one in open(self.output)]
+        assert_equals([one.pk for i, one in enumerate(self.users) if i != 2], [one['id'] for one in rows])
+        assert_equals('nick4', rows[-1]['nick'])
+
+    def test_export_csv(self):
+        call_command('exportprofiles', site_id=self.site.pk, output=self.output, verbosity=0)
+
+        rows = list(csv.reader(open(self.output)))
+        assert_equals(['id', 'email', 'nick'], rows[0])
+        assert_equals([str(self.users[0].pk), 'foo0@bar.cz', 'nick0'], rows[1])
+        assert_equals(5, len(rows))
+
+    def test_export_reports_progress(self):
+        stderr = StringIO()
+        call_command('exportprofiles', site_id=self.site.pk, output=self.output, verbosity=1, stderr=stderr)
+
+        assert_equals(True, stderr.getvalue().startswith('4 profiles exported in'))
+
+    def test_unknown_site_raises(self):
+        assert_raises(CommandError, lambda: call_command('exportprofiles', site_id=0, verbosity=0))
@@ -1,11 +1,14 @@
+import simplejson as json
+
 from django.conf import settings
 from django.core.cache import cache
 from django.forms.widgets import CheckboxInput, TextInput
 from django.test.testcases import TestCase
 
 from entree.enauth.models import Identity
-from entree.host.forms import ProfileForm
-from entree.host.models import SiteProperty, EntreeSite, TYPE_BOOL, TYPE_STR, ProfileData, SiteProfile
+from entree.host.models import EntreeSite, SiteProfile
+from entree.host.profiles.forms import ProfileForm
+from entree.host.profiles.models import SiteProperty, TYPE_BOOL, TYPE_STR, ProfileData, ProfileDataUnique
 
 from nose.tools import assert_raises, assert_equals
 
@@ -101,3 +104,65 @@ class TestProfileForm(TestCase):
         changed_data = SiteProfile.objects.get_data(user=self.user, site=self.site)
 
         assert_equals(NEWVAL, changed_data['foo'])
+
+
+    def test_clean_raises_profile_version(self):
+        SiteProperty.objects.create(slug='foo', site=self.site)
+        profile = SiteProfile.objects.create(user=self.user, site=self.site, is_active=True)
+
+        form = ProfileForm(user=self.user, site=self.site, data={'foo': 'bar', 'dummy_is_activated': True})
+        assert_equals(True, form.is_valid())
+
+        assert SiteProfile.objects.get_version(user=self.user, site=self.site) > profile.version
+
+    def test_clean_rebuilds_profile_document(self):
+        SiteProperty.objects.create(slug='foo', site=self.site)
+        SiteProfile.objects.create(user=self.user, site=self.site, is_active=True)
+        SiteProfile.objects.get_document(user=self.user, site=self.site)
+
+        form = ProfileForm(user=self.user, site=self.site, data={'foo': 'bar', 'dummy_is_activated': True})
+        assert_equals(True, form.is_valid())
+
+        with self.assertNumQueries(0):
+            document = SiteProfile.objects.get_document(user=self.user, site=self.site)
+
+        assert_equals('bar', json.loads(document['content'])['foo'])
+        assert_equals(SiteProfile.objects.get_document_version(user=self.user, site=self.site), document['version'])
+
+    def _bulk_form(self, count, unique=False):
+        props = [SiteProperty.objects.create(slug='foo%s' % i, is_unique=unique, site=self.site) for i in range(count)]
+        data = dict([(one.slug, 'val%s' % i) for i, one in enumerate(props)])
+        return ProfileForm(user=self.user, site=self.site, data=data), data
+
+    def test_save_items_bulk_inserts(self):
+        form, data = self._bulk_form(30)
+
+        #existing data of both tables + one bulk insert
+        with self.assertNumQueries(3):
+            assert_equals([], form.save_items(data))
+
+        assert_equals(30, ProfileData.objects.filter(user=self.user).count())
+
+    def test_save_items_skips_unchanged_values(self):
+        form, data = self._bulk_form(30)
+        form.save_items(data)
+
+        data['foo0'] = 'changed'
+        with self.assertNumQueries(3):
+            form.save_items(data)
+
+        assert_equals('changed', ProfileData.objects.get(user=self.user, site_property__slug='foo0').value)
+
+    def test_save_items_reports_conflicts_per_field(self):
+        form, data = self._bulk_form(3, unique=True)
+        ProfileForm(user=Identity.objects.create(email='foo2@bar.cz'), site=self.site).save_items({'foo1': 'val1'})
+
+        assert_equals(['foo1'], form.save_items(data))
+        assert_equals(2, ProfileDataUnique.objects.filter(user=self.user).count())
+
+    def test_save_items_long_value(self):
+        form, data = self._bulk_form(1)
+        data['foo0'] = 'x' * 30
+        form.save_items(data)
+
+        assert_equals('x' * 30, ProfileData.objects.get(user=self.user).value)
@@ -4,10 +4,12 @@ from django.test.testcases import TestCase
 from django.core.cache import cache
 from django.conf import settings
 from entree.enauth.models import Identity
+from entree.host.profiles.forms import ProfileForm
 
-from entree.host.models import SiteProfile, EntreeSite, SiteProperty, ProfileData, ProfileDataUnique, TYPE_INT, TYPE_BOOL
+from entree.host.models import SiteProfile, EntreeSite
+from entree.host.profiles.models import SiteProperty, ProfileData, ProfileDataUnique, TYPE_INT, TYPE_BOOL
 
-from nose.tools import assert_raises, assert_equals
+from nose.tools import assert_raises, assert_equals, assert_not_equals
 
 
 ENTREE = settings.ENTREE
@@ -42,6 +44,24 @@ class TestSiteProperty(TestCase):
         assert_equals([prop], props)
 
 
+    def test_site_props_cached(self):
+        prop = SiteProperty.objects.create(site=self.site, name='foo', slug='foo')
+        resident_prop = SiteProperty.objects.create(site=self.nosite, name='bar', slug='bar')
+
+        assert_equals([prop, resident_prop], SiteProperty.objects.get_site_props(site=self.site))
+
+        with self.assertNumQueries(0):
+            props = SiteProperty.objects.get_site_props(site=self.site)
+            assert_equals([prop, resident_prop], props)
+            assert_equals('foo', props[0].slug)
+
+    def test_site_props_cache_flushed_on_delete(self):
+        prop = SiteProperty.objects.create(site=self.site, name='foo', slug='foo')
+        assert_equals([prop], SiteProperty.objects.get_site_props(site=self.site))
+
+        prop.delete()
+        assert_equals([], SiteProperty.objects.get_site_props(site=self.site))
+
     def test_save_prop_with_existing_slug_in_resident_raises(self):
 
         SiteProperty.objects.create(site=self.nosite, slug='foo')
@@ -265,3 +285,138 @@ class TestSiteProfile(TestCase):
 
         dato.set_value(data_int*2)
         assert_equals(dato.value_int, data_int*2)
+
+    def test_profile_version_raised_on_save(self):
+        version = self.user_site_profile.version
+
+        self.user_site_profile.is_active = False
+        self.user_site_profile.save()
+
+        assert_equals(version + 1, SiteProfile.objects.get_version(user=self.user, site=self.site))
+
+    def test_stale_profile_does_not_lower_version(self):
+        stale = SiteProfile.objects.get(pk=self.user_site_profile.pk)
+        SiteProfile.objects.bump_version(pk=stale.pk)
+        SiteProfile.objects.bump_version(pk=stale.pk)
+        version = SiteProfile.objects.get_version(user=self.user, site=self.site)
+
+        stale.save()
+
+        assert_equals(version + 1, SiteProfile.objects.get_version(user=self.user, site=self.site))
+
+    def test_document_version_changed_by_property_change(self):
+        version = SiteProfile.objects.get_document_version(user=self.user, site=self.site)
+
+        prop = SiteProperty.objects.create(slug='new_prop', site=self.site)
+        created_version = SiteProfile.objects.get_document_version(user=self.user, site=self.site)
+        assert_not_equals(version, created_version)
+
+        prop.delete()
+        assert_not_equals(created_version, SiteProfile.objects.get_document_version(user=self.user, site=self.site))
+
+    def test_property_change_does_not_touch_profiles(self):
+        version = SiteProfile.objects.get_version(user=self.user, site=self.site)
+
+        SiteProperty.objects.create(slug='new_prop', site=self.nosite)
+        assert_equals(version, SiteProfile.objects.get_version(user=self.user, site=self.site))
+
+    def test_missing_profile_version(self):
+        user = Identity.objects.create(email='xxx@bar.cz')
+        assert_equals(0, SiteProfile.objects.get_version(user=user, site=self.site))
+
+    def test_get_cached_read_through(self):
+        key = dict(user=self.user, site=self.site)
+        SiteProfile.objects.get_cached(key)
+
+        with self.assertNumQueries(0):
+            SiteProfile.objects.get_cached(key)
+
+    def test_get_cached_counts_hits_and_misses(self):
+        stats = SiteProfile.objects.cache_stats
+        stats.reset()
+
+        key = dict(user=self.user, site=self.site)
+        SiteProfile.objects.get_cached(key)
+        SiteProfile.objects.get_cached(key)
+
+        assert_equals(dict(hit=1, miss=1), stats.get_counts())
+
+    def test_property_change_flushes_profile_cache(self):
+        key = dict(user=self.user, site=self.site)
+        SiteProfile.objects.get_cached(key)
+
+        SiteProperty.objects.create(slug='new_prop', site=self.site)
+        assert 'new_prop' in SiteProfile.objects.get_cached(key)
+
+    def test_profile_save_flushes_profile_cache(self):
+        key = dict(user=self.user, site=self.site)
+        SiteProfile.objects.get_cached(key)
+
+        ProfileData(user=self.user, site_property=self.site_prop).set_value('foo')
+        self.user_site_profile.save()
+
+        assert_equals('foo', SiteProfile.objects.get_cached(key)[self.site_prop.slug])
+
+    def test_get_cached_query_count_independent_of_properties(self):
+        props = [SiteProperty.objects.create(slug='prop%s' % i, site=self.site) for i in range(20)]
+        for i, one in enumerate(props):
+            ProfileData(user=self.user, site_property=one).set_value('long value number %s' % i + 'x' * 20)
+        SiteProperty.objects.get_site_props(site=self.site, cascade=False)
+
+        #ProfileData, ProfileDataUnique, all big values at once
+        with self.assertNumQueries(3):
+            data = SiteProfile.objects.get_cached(dict(user=self.user, site=self.site), recache=True)
+
+        assert_equals('long value number 7' + 'x' * 20, data['prop7'])
+
+    def test_get_data_loads_site_and_resident_data_at_once(self):
+        ProfileData(user=self.user, site_property=self.site_prop).set_value('site value')
+        ProfileData(user=self.user, site_property=self.nosite_prop).set_value('resident value')
+        SiteProperty.objects.get_site_props(site=self.site)
+
+        #SiteProfile, ProfileData, ProfileDataUnique
+        with self.assertNumQueries(3):
+            data = SiteProfile.objects.get_data(user=self.user, site=self.site)
+
+        assert_equals('site value', data[self.site_prop.slug])
+        assert_equals('resident value', data[self.nosite_prop.slug])
+
+    def test_get_data_does_not_create_profile(self):
+        user = Identity.objects.create(email='xxx@bar.cz')
+
+        assert_equals({'is_active': False}, SiteProfile.objects.get_data(user=user, site=self.site))
+        assert_equals(False, SiteProfile.objects.filter(user=user).exists())
+
+    def test_profile_created_on_activation(self):
+        user = Identity.objects.create(email='xxx@bar.cz')
+        form = ProfileForm(user=user, site=self.site, data={self.site_prop.slug: 'foo', 'dummy_is_activated': True})
+
+        assert_equals(False, SiteProfile.objects.is_active(user=user, site=self.site))
+        assert_equals(True, form.is_valid())
+        assert_equals(True, SiteProfile.objects.is_active(user=user, site=self.site))
+
+    def test_search_profile_data_by_value(self):
+        other = Identity.objects.create(email='xxx@bar.cz')
+        SiteProfile.objects.create(user=other, site=self.site, is_active=True)
+
+        ProfileData(user=self.user, site_property=self.site_prop).set_value('yes')
+        ProfileData(user=other, site_property=self.site_prop).set_value('no')
+
+        assert_equals([self.user.pk], ProfileData.objects.search(self.site_prop, 'yes', site=self.site))
+        assert_equals([other.pk], ProfileData.objects.search(self.site_prop, 'no', site=self.site))
+
+    def test_search_paginates_by_identity_id(self):
+        users = [Identity.objects.create(email='foo%s@bar.cz' % i) for i in range(3)]
+        for one in users:
+            ProfileData(user=one, site_property=self.site_prop).set_value('yes')
+
+        first = ProfileData.objects.search(self.site_prop, 'yes', limit=2)
+        second = ProfileData.objects.search(self.site_prop, 'yes', after=first[-1], limit=2)
+
+        assert_equals(sorted([one.pk for one in users]), first + second)
+
+    def test_search_skips_inactive_profiles(self):
+        user = Identity.objects.create(email='xxx@bar.cz')
+        ProfileData(user=user, site_property=self.site_prop).set_value('yes')
+
+        assert_equals([], ProfileData.objects.search(self.site_prop, 'yes', site=self.site))
@@ -1,8 +1,10 @@
 # -*- coding: utf-8 -*-
 from base64 import b64encode
+from datetime import datetime, timedelta
 
 from django.core.cache import cache
 from django.core.urlresolvers import reverse
+from django.db import connection
 from django.test.testcases import TestCase
 from django.conf import settings
 
@@ -54,11 +56,68 @@ class TestSiteManagers(TestCase):
         retrieved = EntreeSite.objects.get_cached('foo')
         assert_equals('bar', retrieved)
 
+    def test_get_cached_site_without_query(self):
+        site = EntreeSite.objects.create(title='foo', pk=settings.ENTREE['NOSITE_ID']+1)
+
+        assert_equals(site, EntreeSite.objects.get_cached(pk=site.pk))
+        with self.assertNumQueries(0):
+            assert_equals(site, EntreeSite.objects.get_cached(pk=str(site.pk)))
+
+    def test_get_cached_missing_site(self):
+        assert_raises(EntreeSite.DoesNotExist, lambda: EntreeSite.objects.get_cached(pk=12345))
+
+        with self.assertNumQueries(0):
+            assert_raises(EntreeSite.DoesNotExist, lambda: EntreeSite.objects.get_cached(pk=12345))
+            assert_raises(EntreeSite.DoesNotExist, lambda: EntreeSite.objects.get_cached(pk='foo'))
+
+    def test_get_cached_site_flushed_on_save(self):
+        site = EntreeSite.objects.create(title='foo', pk=settings.ENTREE['NOSITE_ID']+1)
+        EntreeSite.objects.get_cached(pk=site.pk)
+
+        site.title = 'bar'
+        site.save()
+        assert_equals('bar', EntreeSite.objects.get_cached(pk=site.pk).title)
+
+    def test_registry_lookups(self):
+        site = EntreeSite.objects.create(title='foo', url='http://foo.example.com/bar/', is_default=True,
+                                         pk=settings.ENTREE['NOSITE_ID']+1)
+        EntreeSite.objects.get_cached(pk=site.pk)
+
+        with self.assertNumQueries(0):
+            assert_equals(site, EntreeSite.objects.get_cached(hostname='foo.example.com'))
+            assert_equals(site, EntreeSite.objects.get_cached(is_default=True))
+            assert_equals(['foo.example.com'], EntreeSite.objects.get_whitelist()['domains'])
+
+    def test_registry_follows_db_change_stamp(self):
+        site = EntreeSite.objects.create(title='foo', pk=settings.ENTREE['NOSITE_ID']+1)
+        registry = EntreeSite.objects.registry
+        registry.get_index()
+
+        #bypasses ORM, only DB stamp can tell
+        connection.cursor().execute("UPDATE %s SET title = %%s, modified = %%s WHERE %s = %%s" % (
+            EntreeSite._meta.db_table, EntreeSite._meta.pk.column), ['bar', datetime.now() + timedelta(seconds=1), site.pk])
+        registry._checked = 0
+
+        assert_equals('bar', EntreeSite.objects.get_cached(pk=site.pk).title)
+
+    def test_registry_follows_queryset_update(self):
+        site = EntreeSite.objects.create(title='foo', pk=settings.ENTREE['NOSITE_ID']+1)
+        EntreeSite.objects.registry.get_index()
+
+        #`modified` isn't touched by update(), so stamp stays the same
+        EntreeSite.objects.filter(pk=site.pk).update(title='bar')
+
+        assert_equals('bar', EntreeSite.objects.get_cached(pk=site.pk).title)
+
+    def test_get_cached_unsupported_lookup(self):
+        assert_raises(ValueError, lambda: EntreeSite.objects.get_cached(title='foo'))
+
 
 
 class TestNextUrl(TestCase):
 
     def setUp(self):
+        cache.clear()
         self.user = Identity.objects.create(email='foo@bar.cz')
         self.valid_site = EntreeSite.objects.create(id=ENTREE['SITE_ID'], title='foo', is_active=True, secret=ENTREE['SECRET_KEY'], url="http://foobar.cz")
 
@@ -90,3 +149,21 @@ class TestNextUrl(TestCase):
         next_url = b64encode("%s:%sINVALID" % (url, calc_checksum(url, length=SHORT_CHECK) ) )
         ret = get_next_url(self.valid_site.pk, next_url)
         assert_equals(ret.rstrip('/'), self.valid_site.url.rstrip('/'))
+
+    def test_next_url_without_site_queries(self):
+        url = '/foo/'
+        next_url = b64encode("%s:%s" % (url, calc_checksum(url, length=SHORT_CHECK)))
+        get_next_url(self.valid_site.pk, next_url)
+
+        with self.assertNumQueries(0):
+            assert_equals("%s%s" % (self.valid_site.url, url), get_next_url(self.valid_site.pk, next_url))
+
+    def test_next_url_memo_flushed_on_site_change(self):
+        url = '/foo/'
+        next_url = b64encode("%s:%s" % (url, calc_checksum(url, length=SHORT_CHECK)))
+        get_next_url(self.valid_site.pk, next_url)
+
+        self.valid_site.secret = 'changed'
+        self.valid_site.save()
+
+        assert_equals(self.valid_site.url + '/', get_next_url(self.valid_site.pk, next_url))
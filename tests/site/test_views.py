@@ -1,19 +1,28 @@
+import time
+
+import simplejson as json
+
 from base64 import b64encode
+from urllib import urlencode
+from datetime import datetime, timedelta
 from django.contrib.auth.models import AnonymousUser
 from django.core.cache import cache
 from django.core.urlresolvers import reverse
-from django.http import Http404
+from django.http import Http404, QueryDict
 from django.test.testcases import TestCase
 from django.views.decorators.csrf import csrf_exempt
 from django.conf import settings
 
 from entree.user.managers import EntreeUserFetcherMixin
 from entree.common.utils import calc_checksum, SHORT_CHECK
-from entree.enauth.models import Identity
-from entree.host.forms import ProfileForm
-from entree.host.models import EntreeSite, SiteProfile, SiteProperty, ProfileData
-from entree.host.views import ProfileView, ProfileFetchView, ProfileEdit
-
+from entree.enauth.models import Identity, AUTH_TOKEN, MAIL_TOKEN, TOKEN_TTL
+from entree.host.models import EntreeSite, SiteProfile
+from entree.host.profiles.forms import ProfileForm
+from entree.host.profiles.models import SiteProperty, ProfileData
+from entree.host.profiles.views import ProfileEdit, ProfileSearchView
+from entree.host.views import ProfileView, ProfileFetchView, ProfileFetchBatchView
+
+from mock import patch
 from nose.tools import assert_raises, assert_equals
 from tests.auth.test_views import init_request
 
@@ -29,7 +38,7 @@ class TestViews(TestCase):
 
         self.request = init_request()
 
-        self.user = Identity.objects.create(email='foo@bar.cz')
+        self.user = Identity.objects.create(email='foo@bar.cz', is_active=True)
 
         self.valid_site = EntreeSite.objects.create(id=ENTREE['SITE_ID'], title='foo', is_active=True, secret='mysecretkey', url="http://foobar.cz")
         self.nosite = EntreeSite.objects.create(id=ENTREE['NOSITE_ID'], title='nosite', is_active=True, secret='mysecretkey', url="http://nosite.cz")
@@ -154,6 +163,157 @@ class TestViews(TestCase):
 
         assert_equals(200, view.status_code)
 
+    def test_fetch_profile_expired_token_403(self):
+        self.valid_site.secret = ENTREE['SECRET_KEY']
+        self.valid_site.save()
+
+        fetcher = EntreeUserFetcherMixin()
+        token = self.user.create_token()
+        token.touched = datetime.now() - timedelta(seconds=TOKEN_TTL[AUTH_TOKEN] + 1)
+        token.save()
+
+        self.request.method = 'POST'
+        self.request.POST = fetcher._fetch_params(token.value)
+
+        ViewClass = ProfileFetchView.as_view()
+        view = ViewClass(self.request)
+
+        assert_equals(403, view.status_code)
+
+    def _fetch_request(self, token, etag=None):
+        self.valid_site.secret = ENTREE['SECRET_KEY']
+        self.valid_site.save()
+
+        request = init_request()
+        request.method = 'POST'
+        request.POST = EntreeUserFetcherMixin()._fetch_params(token.value)
+        if etag:
+            request.META['HTTP_IF_NONE_MATCH'] = etag
+
+        ViewClass = ProfileFetchView.as_view()
+        return ViewClass(request)
+
+    def test_fetch_profile_not_modified_304(self):
+        token = self.user.create_token()
+        SiteProfile.objects.create(user=self.user, site=self.valid_site, is_active=True)
+
+        view = self._fetch_request(token)
+        assert_equals(200, view.status_code)
+
+        view = self._fetch_request(token, etag=view['ETag'])
+        assert_equals(304, view.status_code)
+
+    def test_fetch_profile_changed_property_200(self):
+        token = self.user.create_token()
+        SiteProfile.objects.create(user=self.user, site=self.valid_site, is_active=True)
+
+        etag = self._fetch_request(token)['ETag']
+        SiteProperty.objects.create(slug='foo', site=self.valid_site)
+
+        view = self._fetch_request(token, etag=etag)
+        assert_equals(200, view.status_code)
+        assert_equals(True, 'foo' in json.loads(view.content))
+
+    def test_fetch_profile_changed_email_200(self):
+        token = self.user.create_token()
+        SiteProfile.objects.create(user=self.user, site=self.valid_site, is_active=True)
+
+        etag = self._fetch_request(token)['ETag']
+        self.user.email = 'changed@bar.cz'
+        self.user.save()
+
+        view = self._fetch_request(token, etag=etag)
+        assert_equals(200, view.status_code)
+        assert_equals('changed@bar.cz', json.loads(view.content)['email'])
+
+    def test_fetch_profile_served_from_document(self):
+        token = self.user.create_token()
+        SiteProfile.objects.create(user=self.user, site=self.valid_site, is_active=True)
+        self._fetch_request(token)
+
+        request = init_request()
+        request.method = 'POST'
+        request.POST = EntreeUserFetcherMixin()._fetch_params(token.value)
+
+        with self.assertNumQueries(0):
+            view = ProfileFetchView.as_view()(request)
+
+        assert_equals(200, view.status_code)
+        assert_equals(self.user.email, json.loads(view.content)['email'])
+
+    def test_fetch_profile_document_follows_schema(self):
+        token = self.user.create_token()
+        SiteProfile.objects.create(user=self.user, site=self.valid_site, is_active=True)
+        self._fetch_request(token)
+
+        SiteProperty.objects.create(slug='foo', site=self.nosite)
+
+        view = self._fetch_request(token)
+        assert_equals(True, 'foo' in json.loads(view.content))
+
+    def _batch_request(self, tokens):
+        self.valid_site.secret = ENTREE['SECRET_KEY']
+        self.valid_site.save()
+
+        params = EntreeUserFetcherMixin()._fetch_batch_params(tokens)
+        self.request.method = 'POST'
+        self.request.POST = QueryDict(urlencode(params))
+
+        ViewClass = ProfileFetchBatchView.as_view()
+        return ViewClass(self.request)
+
+    def test_fetch_batch_returns_profile_per_token(self):
+        prop = SiteProperty.objects.create(slug='foo', site=self.valid_site)
+        other = Identity.objects.create(email='other@bar.cz', is_active=True)
+        SiteProfile.objects.create(user=self.user, site=self.valid_site, is_active=True)
+        ProfileData(user=self.user, site_property=prop).set_value('fooval')
+
+        token = self.user.create_token()
+        other_token = other.create_token()
+
+        view = self._batch_request([token.value, other_token.value, 'UNKNOWN'])
+        assert_equals(200, view.status_code)
+
+        data = json.loads(view.content)
+        assert_equals('fooval', data[token.value]['foo'])
+        assert_equals(self.user.email, data[token.value]['email'])
+        assert_equals(False, data[other_token.value]['is_active'])
+        assert_equals(None, data['UNKNOWN'])
+
+    @patch.dict('entree.enauth.tokens.ENTREE', {'SIGNED_TOKENS': True})
+    def test_fetch_batch_agrees_with_single_fetch(self):
+        SiteProfile.objects.create(user=self.user, site=self.valid_site, is_active=True)
+        inactive = Identity.objects.create(email='inactive@bar.cz')
+        mail_token = self.user.create_token(token_type=MAIL_TOKEN)
+
+        past = time.time() - TOKEN_TTL[AUTH_TOKEN] - 60
+        with patch('entree.enauth.tokens.time.time') as mocked_time:
+            mocked_time.return_value = past
+            expired = self.user.create_token()
+
+        tokens = [self.user.create_token(), inactive.create_token(), expired, mail_token]
+        batch = json.loads(self._batch_request([one.value for one in tokens]).content)
+
+        for token in tokens:
+            single = self._fetch_request(token)
+            expected = json.loads(single.content) if single.status_code == 200 else None
+            assert_equals(expected, batch[token.value])
+        assert_equals(self.user.email, batch[tokens[0].value]['email'])
+
+    def test_fetch_batch_invalid_checksum_403(self):
+        token = self.user.create_token()
+
+        self.valid_site.secret = ENTREE['SECRET_KEY']
+        self.valid_site.save()
+
+        params = EntreeUserFetcherMixin()._fetch_batch_params([token.value])
+        params.append(('token', 'INJECTED'))
+        self.request.method = 'POST'
+        self.request.POST = QueryDict(urlencode(params))
+
+        ViewClass = ProfileFetchBatchView.as_view()
+        assert_equals(403, ViewClass(self.request).status_code)
+
     def test_edit_profile_no_site_id_raises_404(self):
         ViewClass = ProfileEdit.as_view()
         assert_raises(Http404, lambda: ViewClass(self.request))
@@ -251,3 +411,50 @@ class TestViews(TestCase):
 
         form = ProfileForm(user=self.user, site=self.valid_site)
         assert_equals(form.fields[prop.slug].initial, NEWVAL)
+
+
+class TestProfileSearchView(TestCase):
+
+    def setUp(self):
+        super(TestProfileSearchView, self).setUp()
+        cache.clear()
+
+        self.site = EntreeSite.objects.create(id=ENTREE['SITE_ID'], title='foo', is_active=True, secret='mysecretkey', url="http://foobar.cz")
+        self.prop = SiteProperty.objects.create(slug='foo', site=self.site)
+        self.users = [Identity.objects.create(email='foo%s@bar.cz' % i) for i in range(3)]
+        for one in self.users:
+            SiteProfile.objects.create(user=one, site=self.site, is_active=True)
+            ProfileData(user=one, site_property=self.prop).set_value('yes')
+
+    def _search(self, value='yes', checksum=None, **params):
+        request = init_request()
+        request.method = 'POST'
+        request.POST = dict(params, site_id=str(self.site.pk), property=self.prop.slug, value=value,
+            checksum=checksum or calc_checksum("%s:%s:%s" % (self.site.pk, self.prop.slug, value), salt=self.site.secret))
+        return ProfileSearchView.as_view()(request)
+
+    def test_search_returns_ids(self):
+        view = self._search()
+
+        assert_equals(200, view.status_code)
+        assert_equals({'ids': [one.pk for one in self.users], 'next': None}, json.loads(view.content))
+
+    def test_search_pages_follow_next_cursor(self):
+        first = json.loads(self._search(limit='2').content)
+        assert_equals([self.users[0].pk, self.users[1].pk], first['ids'])
+        assert_equals(self.users[1].pk, first['next'])
+
+        second = json.loads(self._search(limit='2', after=str(first['next'])).content)
+        assert_equals({'ids': [self.users[2].pk], 'next': None}, second)
+
+    def test_search_limit_clamped(self):
+        for limit in ('0', '-1'):
+            content = json.loads(self._search(limit=limit).content)
+            assert_equals({'ids': [self.users[0].pk], 'next': self.users[0].pk}, content)
+
+    def test_search_invalid_parameters_403(self):
+        assert_equals(403, self._search(limit='foo').status_code)
+        assert_equals(403, self._search(after='foo').status_code)
+
+    def test_search_invalid_checksum_403(self):
+        assert_equals(403, self._search(checksum='foo').status_code)